@@ -0,0 +1,226 @@
+#!/usr/bin/python
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+
+import position
+from engine import Engine, EngineProtocol, SearchResult
+
+# Each worker process keeps its own Engine. It starts afresh for each
+# position, except one which follows on from the position before it (the same
+# game, one move later), which reuses what was learned about that; so the
+# result for a line only depends on the lines before it, and not on how they
+# were shared out between the workers.
+_engine = None
+_budget = None
+_seed = None
+
+
+def _init_worker(movetime, playouts, seed):
+    global _engine, _budget, _seed
+    _engine = Engine(seed=seed)
+    _budget = (movetime, playouts)
+    _seed = seed
+
+
+def analyse(lines):
+    """Analyses each of lines (the arguments to the engine's position command,
+    such as "startpos moves 1111 1100") in turn with the worker's budget,
+    each but the first following on from the one before. Returns a list of
+    (output line without a newline, SearchResult), the SearchResult being
+    None if the line isn't a valid position."""
+    _engine.new_game()
+    if _seed is not None:
+        _engine.random.seed("{} {}".format(_seed, lines[0]))
+    results = []
+    for line in lines:
+        try:
+            pos = EngineProtocol.parse_position(line.split())
+        except ValueError as e:
+            results.append(("{}\terror\t{}".format(line, e), None))
+            continue
+        result = _engine.search(pos, movetime=_budget[0], playouts=_budget[1])
+        results.append((output_line(line, pos, result), result))
+    return results
+
+
+def follows(pos, previous):
+    """Returns whether pos is previous after one more move"""
+    if previous is None or pos.depth != previous.depth or pos.ply != previous.ply + 1:
+        return False
+    new = [i for i in range(len(pos.cells)) if pos.cells[i] != previous.cells[i]]
+    if len(new) != 1 or not previous.is_legal(new[0]):
+        return False
+    after = previous.copy()
+    after.play(new[0])
+    return after == pos
+
+
+def output_line(line, pos, result):
+    """Returns the output line, without a newline, for the result of
+    analysing line, which describes pos"""
+    if result.bestmove is None:
+        bestmove = "(none)"
+    else:
+        bestmove = position.to_move_notation(result.bestmove, pos.depth)
+    return "{}\t{}\t{:.3f}\t{}".format(line, bestmove, result.score, result.nodes)
+
+
+def transform_result(result, tables, k, to):
+    """Returns result, a SearchResult for a position whose canonical symmetry
+    is k, as it would be for the position of the same canonical hash whose
+    canonical symmetry is to"""
+    inverse = position.INVERSE_SYMMETRIES[to]
+
+    def move(m):
+        return tables.transform(tables.transform(m, k), inverse)
+
+    return SearchResult(
+        bestmove=None if result.bestmove is None else move(result.bestmove),
+        score=result.score,
+        nodes=result.nodes,
+        playouts=result.playouts,
+        pv=[move(m) for m in result.pv],
+        elapsed=result.elapsed)
+
+
+def completed_lines(path):
+    """Returns the number of complete lines in the results file at path,
+    truncating any partial line left by an interruption"""
+    if not os.path.exists(path):
+        return 0
+    done = 0
+    end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.endswith(b"\n"):
+                done += 1
+                end += len(line)
+    if end != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    return done
+
+
+def run(infile, outfile, movetime=None, playouts=None, jobs=None, window=4096, chunksize=4, progress=None,
+        analysis_cache=None, seed=None):
+    """Analyses every position in infile (one per line) and appends the
+    results to outfile in the same order. Positions which already have a
+    result in outfile are skipped, so an interrupted run can be restarted.
+    At most window positions are held in memory at once, and a position
+    which comes up more than once among them (or a rotation or reflection of
+    it) is only searched once.
+
+    If analysis_cache (a cache.AnalysisCache) is given, positions it has an
+    analysis of aren't searched again, and new analyses are added to it.
+    Only this process uses the cache, so the workers' results are written in
+    batches from one place.
+
+    Searches use seed, if it is given, with the line each run of positions
+    from the same game starts at, so the same input gives the same results
+    however many workers there are."""
+    skip = completed_lines(outfile)
+    done = skip
+    if analysis_cache is not None:
+        import cache
+        search_budget = cache.budget(movetime, playouts)
+    with open(infile) as source, open(outfile, "a") as sink, \
+            multiprocessing.Pool(jobs, _init_worker, (movetime, playouts, seed)) as pool:
+        lines = (line.rstrip("\n") for line in itertools.islice(source, skip, None))
+        while True:
+            batch = list(itertools.islice(lines, window))
+            if not batch:
+                break
+            # (line, position, key, k, cached result) for each line. Lines
+            # with the same canonical position (see Position.canonical()) as
+            # an earlier one in the window, and lines with a cached result,
+            # aren't searched; the rest go to the workers.
+            entries = []
+            keys = set()
+            runs = []  # Lists of lines to search, each following on from the last
+            previous = None
+            for line in batch:
+                (pos, key, k, cached) = (None, None, None, None)
+                try:
+                    pos = EngineProtocol.parse_position(line.split())
+                except ValueError:
+                    pass
+                if pos is not None:
+                    (hash, k) = pos.canonical()
+                    key = (pos.depth, hash)
+                    if analysis_cache is not None and key not in keys:
+                        cached = analysis_cache.get(pos, search_budget)
+                entries.append((line, pos, key, k, cached))
+                if key is None or (key not in keys and cached is None):
+                    if pos is not None and follows(pos, previous):
+                        runs[-1].append(line)
+                    else:
+                        runs.append([line])
+                    previous = pos
+                else:
+                    previous = None
+                keys.add(key)
+            results = (r for group in pool.imap(analyse, runs, chunksize) for r in group)
+            found = {}  # key: (result, k), for the first line with each key
+            for (line, pos, key, k, cached) in entries:
+                if key in found:
+                    (result, first_k) = found[key]
+                    text = output_line(line, pos, transform_result(result, pos.tables, first_k, k))
+                elif cached is not None:
+                    found[key] = (cached, k)
+                    text = output_line(line, pos, cached)
+                else:
+                    (text, result) = next(results)
+                    if result is not None:
+                        found[key] = (result, k)
+                        if analysis_cache is not None:
+                            analysis_cache.put(pos, search_budget, result)
+                sink.write(text + "\n")
+                done += 1
+            sink.flush()
+            if analysis_cache is not None:
+                analysis_cache.flush()
+            if progress is not None:
+                progress(done)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyse a file of positions, one per line, written as the "
+                    "arguments to the engine's position command.")
+    parser.add_argument("infile")
+    parser.add_argument("outfile", help="results are appended here; a run resumes where it stopped")
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument("--movetime", type=int, help="milliseconds per position")
+    budget.add_argument("--playouts", type=int, help="playouts per position (default 1000)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--cache", help="analysis cache file (default: the one shared with the GUI)")
+    parser.add_argument("--no-cache", action="store_true", help="search every position, without a cache")
+    parser.add_argument("--seed", type=int, help="random seed, for results which are the same every run")
+    args = parser.parse_args(argv)
+
+    if args.movetime is None and args.playouts is None:
+        args.playouts = 1000
+
+    analysis_cache = None
+    if not args.no_cache:
+        from cache import AnalysisCache
+        analysis_cache = AnalysisCache(args.cache, Engine().version())
+
+    def progress(done):
+        print("{} positions analysed".format(done), file=sys.stderr)
+
+    try:
+        run(args.infile, args.outfile, args.movetime, args.playouts, args.jobs, progress=progress,
+            analysis_cache=analysis_cache, seed=args.seed)
+    finally:
+        if analysis_cache is not None:
+            analysis_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+# Compares the array-backed NodePool used by Engine, both preallocated and
+# growing as needed, with a tree of one Python object per node: memory per
+# node (as nodes per GB), the time to build a large tree, and search
+# iterations per second.
+#
+#   python bench_nodepool.py [--nodes N] [--playouts N]
+
+import argparse
+import gc
+import math
+import time
+import tracemalloc
+
+import position
+from engine import Engine
+from nodepool import NodePool
+
+
+class ObjectNode(object):
+    __slots__ = ("visits", "value", "children", "move", "parent")
+
+    def __init__(self, move, parent):
+        self.visits = 0
+        self.value = 0.0
+        self.children = None
+        self.move = move
+        self.parent = parent
+
+
+class ObjectTreeEngine(Engine):
+    """The same search as Engine, but with a tree of ObjectNodes"""
+
+    def search(self, pos, playouts):
+        self.root = ObjectNode(0, None)
+        self.nodes = 1
+        for i in range(playouts):
+            self._iterate(pos)
+
+    def _iterate(self, root_pos):
+        pos = root_pos.copy()
+        node = self.root
+        while node.children:
+            node = self._select(node)
+            pos.play(node.move)
+
+        if pos.winner is None and (node.visits or node is self.root):
+            moves = pos.legal_moves()
+            self.random.shuffle(moves)
+            node.children = [ObjectNode(m, node) for m in moves]
+            self.nodes += len(moves)
+            node = node.children[0]
+            pos.play(node.move)
+
+        if pos.winner is not None:
+            result = pos.result(pos.player)
+        else:
+            result = self._playout(pos)
+
+        while node is not None:
+            result = -result
+            node.visits += 1
+            node.value += result
+            node = node.parent
+
+    def _select(self, node):
+        best = None
+        best_score = -math.inf
+        log_visits = math.log(node.visits + 1)
+        for c in node.children:
+            if c.visits == 0:
+                return c
+            score = c.value / c.visits + self.exploration * math.sqrt(log_visits / c.visits)
+            if score > best_score:
+                best = c
+                best_score = score
+        return best
+
+
+def build_objects(count):
+    """Builds a tree of count ObjectNodes with nine children per node"""
+    root = ObjectNode(0, None)
+    frontier = [root]
+    made = 1
+    i = 0
+    while made < count:
+        node = frontier[i]
+        i += 1
+        node.children = [ObjectNode(m, node) for m in range(min(9, count - made))]
+        frontier.extend(node.children)
+        made += len(node.children)
+    return root
+
+
+def build_pool(count, initial=None):
+    """Builds a NodePool tree of count nodes with nine children per node"""
+    pool = NodePool(count, initial=initial)
+    node = pool.root
+    while pool.size < count:
+        pool.expand(node, range(min(9, count - pool.size)))
+        node += 1
+    return pool
+
+
+def build_growing_pool(count):
+    """Builds a tree as build_pool() does, in a pool which starts small"""
+    return build_pool(count, Engine.INITIAL_NODES)
+
+
+def measure(build, count):
+    """Returns (bytes per node, seconds) to build a tree of count nodes"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = build(count)
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tree
+    return (used / count, elapsed)
+
+
+def iterations_per_second(engine, playouts):
+    pos = position.from_notation(position.STARTPOS)
+    start = time.perf_counter()
+    engine.search(pos, playouts=playouts)
+    return playouts / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=1000000)
+    parser.add_argument("--playouts", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("{:<10} {:>12} {:>14} {:>12} {:>14}".format(
+        "tree", "bytes/node", "nodes/GB", "build (s)", "iterations/s"))
+    for (name, build, engine) in (
+            ("objects", build_objects, ObjectTreeEngine(seed=1)),
+            ("prealloc", build_pool, Engine(seed=1, preallocate=True)),
+            ("growing", build_growing_pool, Engine(seed=1))):
+        rate = iterations_per_second(engine, args.playouts)
+        (per_node, elapsed) = measure(build, args.nodes)
+        print("{:<10} {:>12.1f} {:>14,.0f} {:>12.2f} {:>14,.0f}".format(
+            name, per_node, 2 ** 30 / per_node, elapsed, rate))
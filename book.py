@@ -0,0 +1,274 @@
+#!/usr/bin/python
+
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+
+import position
+from position import Position
+
+# An opening book is a file of fixed size records sorted by position hash, so
+# that it can be memory-mapped and binary searched without being loaded:
+#
+#   header: MAGIC, then the number of plies the book covers (uint32) and
+#           padding to 16 bytes
+#   record: hash (uint64), visits, wins and draws (uint32 each; wins and
+#           draws are for the player to move), best reply (uint16 square
+#           index), padding to 24 bytes
+#
+# Books are built from game records in the JSON format described in the
+# README, one game per line. Building happens in two steps so that memory
+# stays bounded however many games there are: worker processes turn games
+# into (hash, reply) statistics which are gathered in memory and written out
+# as sorted runs whenever there are too many, then the runs are merged into
+# the book.
+
+MAGIC = b"UXOBOOK1"
+HEADER = struct.Struct("<8sI4x")
+RECORD = struct.Struct("<QIIIH2x")
+RUN_RECORD = struct.Struct("<QHIII")  # hash, reply, games, wins, draws
+
+
+class BookEntry(object):
+    def __init__(self, visits, wins, draws, move):
+        self.visits = visits
+        self.wins = wins  # For the player to move
+        self.draws = draws
+        self.move = move  # The best reply, as a square index
+
+    def score(self):
+        """Returns the expected result in [-1, 1] for the player to move"""
+        losses = self.visits - self.wins - self.draws
+        return (self.wins - losses) / self.visits
+
+
+class Book(object):
+    """A memory-mapped opening book"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.plies) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not an opening book".format(path))
+        self.size = (len(self._map) - HEADER.size) // RECORD.size
+        self._digest = None
+
+    def digest(self):
+        """Returns a hex digest of the book's contents"""
+        if self._digest is None:
+            self._digest = hashlib.sha1(self._map).hexdigest()
+        return self._digest
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def probe(self, hash):
+        """Returns the BookEntry for the position with hash, or None"""
+        data = self._map
+        lo = 0
+        hi = self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            (key,) = struct.unpack_from("<Q", data, offset)
+            if key < hash:
+                lo = mid + 1
+            elif key > hash:
+                hi = mid
+            else:
+                return BookEntry(*RECORD.unpack_from(data, offset)[1:])
+        return None
+
+
+def game_statistics(line, plies):
+    """Returns a list of (hash, reply, wins, draws) for each of the first
+    plies positions in the game record line, where wins and draws are 1 or 0
+    for the player to move. Unfinished or unreadable games give nothing."""
+    try:
+        record = json.loads(line)
+        moves = record["moves"]
+        if not moves:
+            return []
+        pos = Position(position.PLAYERS[moves[0]["player"].lower()])
+        seen = []
+        for m in moves:
+            move = position.from_move_coordinates(m["board"], m["square"])
+            if not pos.is_legal(move):
+                return []
+            if pos.ply < plies:
+                seen.append((pos.hash, move, pos.player))
+            pos.play(move)
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError):
+        return []
+    if pos.winner is None:
+        return []
+    return [(hash, move, int(pos.winner == player), int(pos.winner == position.EMPTY))
+            for (hash, move, player) in seen]
+
+
+def _map_games(args):
+    (lines, plies) = args
+    counts = {}
+    for line in lines:
+        for (hash, move, win, draw) in game_statistics(line, plies):
+            c = counts.get((hash, move))
+            if c is None:
+                counts[(hash, move)] = [1, win, draw]
+            else:
+                c[0] += 1
+                c[1] += win
+                c[2] += draw
+    return counts
+
+
+def _write_run(counts, directory):
+    (fd, path) = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        for (key, c) in sorted(counts.items()):
+            f.write(RUN_RECORD.pack(key[0], key[1], c[0], c[1], c[2]))
+    return path
+
+
+def _read_run(path, chunk=RUN_RECORD.size * 4096):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk)
+            if not data:
+                return
+            yield from RUN_RECORD.iter_unpack(data)
+
+
+def _best_reply(replies, min_games):
+    """Returns the reply with the best score for the player to move among
+    those played at least min_games times (or all of them, if none were),
+    breaking ties by how often they were played"""
+    candidates = [r for r in replies if r[1] >= min_games] or replies
+    return max(candidates, key=lambda r: ((r[2] + r[3] / 2) / r[1], r[1]))[0]
+
+
+def build(infiles, outfile, plies=12, jobs=None, max_entries=2000000, chunksize=1000, min_games=5, progress=None):
+    """Builds an opening book in outfile from the game records (one JSON game
+    per line) in infiles, covering the first plies plies of each game. At
+    most max_entries distinct (position, reply) pairs are held in memory at
+    once. Returns the number of positions in the book."""
+    directory = os.path.dirname(os.path.abspath(outfile))
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        runs = []
+        counts = {}
+        games = 0
+
+        def lines():
+            for name in infiles:
+                with open(name) as f:
+                    yield from f
+
+        def chunks():
+            source = lines()
+            while True:
+                chunk = list(itertools.islice(source, chunksize))
+                if not chunk:
+                    return
+                yield (chunk, plies)
+
+        # Pool.imap reads its input as fast as it can, so feed it a bounded
+        # window of chunks at a time
+        with multiprocessing.Pool(jobs) as pool:
+            source = chunks()
+            while True:
+                window = list(itertools.islice(source, 4 * (jobs or os.cpu_count() or 1)))
+                if not window:
+                    break
+                for partial in pool.imap_unordered(_map_games, window):
+                    for (key, c) in partial.items():
+                        total = counts.get(key)
+                        if total is None:
+                            counts[key] = c
+                        else:
+                            total[0] += c[0]
+                            total[1] += c[1]
+                            total[2] += c[2]
+                    if len(counts) >= max_entries:
+                        runs.append(_write_run(counts, tmp))
+                        counts = {}
+                games += sum(len(w[0]) for w in window)
+                if progress is not None:
+                    progress(games)
+        if counts:
+            runs.append(_write_run(counts, tmp))
+            counts = {}
+
+        # Merge the runs: records for one position are adjacent, and records
+        # for one (position, reply) pair may come from several runs
+        written = 0
+        with open(outfile, "wb") as out:
+            out.write(HEADER.pack(MAGIC, plies))
+            merged = heapq.merge(*[_read_run(r) for r in runs])
+            for (hash, records) in itertools.groupby(merged, key=lambda r: r[0]):
+                replies = []
+                for (move, group) in itertools.groupby(records, key=lambda r: r[1]):
+                    totals = [0, 0, 0]
+                    for r in group:
+                        totals[0] += r[2]
+                        totals[1] += r[3]
+                        totals[2] += r[4]
+                    replies.append((move, totals[0], totals[1], totals[2]))
+                out.write(RECORD.pack(
+                    hash,
+                    sum(r[1] for r in replies),
+                    sum(r[2] for r in replies),
+                    sum(r[3] for r in replies),
+                    _best_reply(replies, min_games)))
+                written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser(
+        "build", help="build a book from files of JSON game records, one per line")
+    build_parser.add_argument("games", nargs="+")
+    build_parser.add_argument("-o", "--output", required=True)
+    build_parser.add_argument("--plies", type=int, default=12, help="plies from the start of each game to include")
+    build_parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    build_parser.add_argument("--max-entries", type=int, default=2000000,
+                              help="statistics held in memory before writing a run to disk")
+    build_parser.add_argument("--min-games", type=int, default=5,
+                              help="games a reply needs to be chosen over more popular ones")
+
+    probe_parser = commands.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("position", nargs="+", help="as for the engine's position command")
+
+    args = parser.parse_args(argv)
+    if "build" == args.command:
+        def progress(games):
+            print("{} games read".format(games), file=sys.stderr)
+        written = build(args.games, args.output, args.plies, args.jobs, args.max_entries,
+                        min_games=args.min_games, progress=progress)
+        print("{} positions written to {}".format(written, args.output))
+    else:
+        from engine import EngineProtocol
+        pos = EngineProtocol.parse_position(args.position)
+        entry = Book(args.book).probe(pos.hash)
+        if entry is None:
+            print("not in book")
+        else:
+            print("visits {} wins {} draws {} score {:.3f} bestmove {}".format(
+                entry.visits, entry.wins, entry.draws, entry.score(),
+                position.to_move_notation(entry.move)))
+
+
+if __name__ == "__main__":
+    main()
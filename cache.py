@@ -0,0 +1,199 @@
+#!/usr/bin/python
+
+import collections
+import os
+import sqlite3
+import time
+
+import position
+from engine import SearchResult
+
+# A persistent cache of engine analyses, so that positions which come up again
+# and again (across batch runs, on machines sharing the file, or in the GUI)
+# are only searched once. Analyses are kept in a SQLite database in WAL mode,
+# so that other processes can go on reading while one writes, with a
+# dictionary of the most recently used ones in front of it for hot positions.
+# Writes are held back and made in batches, each in a single transaction.
+#
+# Positions are keyed by their canonical hash (see Position.canonical()), so
+# rotations and reflections of a position share one analysis. Moves are
+# stored as they would be in the canonical position, and mapped back when
+# they are read. An analysis is only reused by the same engine version (see
+# Engine.version()) with the same search budget.
+#
+# Rows which haven't been used for max_age seconds, and then the least
+# recently used rows beyond max_entries, are evicted when the cache is closed.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis (
+    hash INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    engine TEXT NOT NULL,
+    budget TEXT NOT NULL,
+    score REAL NOT NULL,
+    bestmove INTEGER,
+    pv TEXT NOT NULL,
+    nodes INTEGER NOT NULL,
+    playouts INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (hash, depth, engine, budget)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS analysis_used ON analysis (used);
+"""
+
+
+def default_path():
+    """Returns the path of the analysis cache shared by the GUI and tools"""
+    return os.path.join(position.cache_directory(), "analysis.sqlite")
+
+
+def budget(movetime=None, playouts=None):
+    """Returns the description of a search budget stored with an analysis"""
+    if movetime is not None:
+        return "movetime {}".format(movetime)
+    return "playouts {}".format(playouts)
+
+
+class AnalysisCache(object):
+
+    def __init__(self, path=None, version="", lru_size=4096, batch_size=256,
+                 max_entries=1000000, max_age=90 * 24 * 60 * 60):
+        """Opens (or creates) the cache at path, by default default_path().
+        Analyses are stored and looked up for the engine version, usually
+        Engine.version(). Raises sqlite3.Error if the file can't be used."""
+        if path is None:
+            path = default_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.version = version
+        self.lru_size = lru_size
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._recent = collections.OrderedDict()  # key: row, least recent first
+        self._pending = {}  # key: row, waiting to be written
+        self._touched = {}  # key: time, for rows read from the database
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def _key(self, pos, budget):
+        """Returns (key, k) for pos, where k is the symmetry which takes pos
+        to its canonical position"""
+        (hash, k) = pos.canonical()
+        # SQLite integers are signed
+        if hash >= 1 << 63:
+            hash -= 1 << 64
+        return ((hash, pos.depth, self.version, budget), k)
+
+    def get(self, pos, budget):
+        """Returns the cached SearchResult for pos with budget, or None"""
+        (key, k) = self._key(pos, budget)
+        row = self._recent.get(key)
+        if row is not None:
+            self._recent.move_to_end(key)
+            self._touch(key)
+        else:
+            row = self._pending.get(key)
+            if row is None:
+                row = self.connection.execute(
+                    "SELECT score, bestmove, pv, nodes, playouts FROM analysis "
+                    "WHERE hash = ? AND depth = ? AND engine = ? AND budget = ?", key).fetchone()
+                if row is None:
+                    return None
+                self._touch(key)
+            self._remember(key, row)
+
+        (score, bestmove, pv, nodes, playouts) = row
+        inverse = position.INVERSE_SYMMETRIES[k]
+        tables = pos.tables
+        if bestmove is not None:
+            bestmove = tables.transform(bestmove, inverse)
+        return SearchResult(
+            bestmove=bestmove,
+            score=score,
+            nodes=nodes,
+            playouts=playouts,
+            pv=[tables.transform(int(m), inverse) for m in pv.split()])
+
+    def put(self, pos, budget, result):
+        """Stores result, a SearchResult for pos with budget. It is written
+        to the database with the next batch."""
+        (key, k) = self._key(pos, budget)
+        tables = pos.tables
+        bestmove = result.bestmove
+        if bestmove is not None:
+            bestmove = tables.transform(bestmove, k)
+        row = (result.score, bestmove, " ".join(str(tables.transform(m, k)) for m in result.pv),
+               result.nodes, result.playouts)
+        self._remember(key, row)
+        self._pending[key] = row
+        self._touched.pop(key, None)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _touch(self, key):
+        """Notes that the row for key was used, so that its time is updated
+        with the next batch. Rows waiting to be written get the time they
+        are written, and a row is only noted once between batches."""
+        if key in self._pending or key in self._touched:
+            return
+        self._touched[key] = time.time()
+        if len(self._touched) >= self.batch_size:
+            self.flush()
+
+    def _remember(self, key, row):
+        self._recent[key] = row
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+
+    def flush(self):
+        """Writes any waiting analyses, and the times cached ones were last
+        used, to the database"""
+        if not self._pending and not self._touched:
+            return
+        now = time.time()
+        db = self.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO analysis "
+                "(hash, depth, engine, budget, score, bestmove, pv, nodes, playouts, used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [key + row + (now,) for (key, row) in self._pending.items()])
+            db.executemany(
+                "UPDATE analysis SET used = ? "
+                "WHERE hash = ? AND depth = ? AND engine = ? AND budget = ?",
+                [(used,) + key for (key, used) in self._touched.items()])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._pending = {}
+        self._touched = {}
+
+    def evict(self):
+        """Deletes analyses which haven't been used for max_age seconds, then
+        the least recently used ones until at most max_entries are left"""
+        db = self.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM analysis WHERE used < ?", (time.time() - self.max_age,))
+            (count,) = db.execute("SELECT COUNT(*) FROM analysis").fetchone()
+            if count > self.max_entries:
+                (oldest,) = db.execute(
+                    "SELECT used FROM analysis ORDER BY used LIMIT 1 OFFSET ?",
+                    (count - self.max_entries - 1,)).fetchone()
+                db.execute("DELETE FROM analysis WHERE used <= ?", (oldest,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """Writes anything waiting, evicts old analyses and closes the
+        database"""
+        self.flush()
+        self.evict()
+        self.connection.close()
@@ -0,0 +1,493 @@
+#!/usr/bin/python
+
+import math
+import random
+import sys
+import threading
+import time
+
+import position
+from nodepool import NodePool, TranspositionTable
+
+
+class SearchResult(object):
+    def __init__(self, bestmove=None, score=0.0, nodes=0, playouts=0, pv=(), elapsed=0.0):
+        self.bestmove = bestmove  # A square index, or None if there are no moves
+        self.score = score  # Expected result in [-1, 1] for the player to move
+        self.nodes = nodes
+        self.playouts = playouts
+        self.pv = pv
+        self.elapsed = elapsed
+
+
+class Engine(object):
+    """A Monte Carlo tree search engine. The search tree is kept in a
+    NodePool between searches, so analysing a position that follows on from
+    the last one searched reuses everything that was learned about it.
+
+    Positions near the root of each search are also kept in a transposition
+    table of visits and value by hash, which outlives the tree: a node seen
+    for the first time starts from the table's results for its position, so
+    positions reached by another move order, or searched before the tree was
+    thrown away for an unrelated position, aren't learned from scratch."""
+
+    # How often (in iterations) to check the clock and the stop flag
+    CHECK_INTERVAL = 64
+    # How often (in seconds) to report progress to the info callback
+    INFO_INTERVAL = 0.5
+    # How many moves past the last position searched to look for the new one
+    # in the tree, before giving up and starting a new tree
+    REUSE_PLIES = 8
+    # The transposition table keeps the results for positions up to this many
+    # plies below the root of each search, in one slot for every
+    # TABLE_FRACTION nodes the engine may use. Its memory counts towards
+    # the engine's limit, so the pool has room for that many fewer nodes.
+    TABLE_PLIES = 4
+    TABLE_FRACTION = 8
+    # Increase this whenever a change to the search changes what it finds, so
+    # that analyses cached by older versions aren't reused
+    VERSION = 3
+    # Nodes the pool has room for when it is created, unless it is
+    # preallocated; it grows from there as needed
+    INITIAL_NODES = 4096
+
+    def __init__(self, max_nodes=1000000, exploration=1.4, seed=None, book=None, book_plies=None,
+                 evaluator=None, preallocate=False, max_memory=None):
+        """book, if given, is a book.Book which is consulted instead of
+        searching for the first book_plies plies of a game (by default, as
+        many as the book covers). evaluator, if given, is an
+        evaluator.Evaluator which scores new leaves of depth 2 positions
+        instead of a random playout. If preallocate is set, the pool has room
+        for max_nodes nodes from the start, which is better for long
+        searches; otherwise it grows as needed, which starts faster.
+        max_nodes limits the memory used by both the pool and the
+        transposition table, counted in nodes (of depth 2 positions);
+        max_memory, if given, is the limit in bytes instead."""
+        if max_memory is None:
+            max_memory = max_nodes * NodePool.node_bytes()
+        self.max_memory = max_memory
+        self.max_nodes = max_memory // NodePool.node_bytes()
+        self.table = TranspositionTable(max(1, self.max_nodes // self.TABLE_FRACTION))
+        self.preallocate = preallocate
+        self.evaluator = evaluator
+        self.exploration = exploration
+        self.random = random.Random(seed)
+        self.book = book
+        if book is not None and book_plies is None:
+            book_plies = book.plies
+        self.book_plies = book_plies
+        self.pool = None
+        self.root_position = None  # The position at the root of the pool
+
+    def version(self):
+        """Returns a description of the engine and the settings which affect
+        its results, stored with cached analyses so that they are only reused
+        by an engine that would have found the same thing"""
+        description = "mcts {} exploration {}".format(Engine.VERSION, self.exploration)
+        if self.book is not None:
+            description += " book {} {}".format(self.book_plies, self.book.digest())
+        if self.evaluator is not None:
+            description += " evaluator {}".format(self.evaluator.digest())
+        return description
+
+    def new_game(self):
+        """Forgets everything learned in earlier searches"""
+        self.root_position = None
+        self.table.clear()
+        if self.pool is not None:
+            self.pool.reset()
+
+    def search(self, pos, movetime=None, playouts=None, stop=None, info=None):
+        """Searches pos until movetime milliseconds have passed, playouts
+        iterations have been run, or the threading.Event stop is set, whichever
+        comes first. With none of those given, searches a single iteration.
+        info, if given, is called with a SearchResult every INFO_INTERVAL
+        seconds. Returns a SearchResult."""
+        start = time.monotonic()
+        deadline = None if movetime is None else start + movetime / 1000
+        if movetime is None and playouts is None and stop is None:
+            playouts = 1
+        next_info = start + self.INFO_INTERVAL
+
+        if pos.winner is not None:
+            return SearchResult(score=float(pos.result(pos.player)))
+
+        if self.book is not None and pos.depth == 2 and pos.ply < self.book_plies:
+            entry = self.book.probe(pos.hash)
+            # Check the move too, in case of a hash collision
+            if entry is not None and pos.is_legal(entry.move):
+                return SearchResult(
+                    bestmove=entry.move,
+                    score=entry.score(),
+                    pv=[entry.move],
+                    elapsed=time.monotonic() - start)
+
+        self._set_root(pos)
+        self._full = False
+        iterations = 0
+        ran = 0
+        while True:
+            if self._full:
+                self.pool.prune(self.pool.capacity // 2)
+                self._full = False
+            ran += self._iterate(pos)
+            iterations += 1
+            if playouts is not None and iterations >= playouts:
+                break
+            if iterations % self.CHECK_INTERVAL == 0:
+                if stop is not None and stop.is_set():
+                    break
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                if info is not None and now >= next_info:
+                    info(self._result(iterations, ran, now - start))
+                    next_info = now + self.INFO_INTERVAL
+
+        return self._result(iterations, ran, time.monotonic() - start)
+
+    def _set_root(self, pos):
+        """Makes pos the root of the tree, keeping the subtree for pos if it
+        is already in the tree"""
+        if self.pool is None or self.pool.squares != len(pos.cells):
+            squares = len(pos.cells)
+            table_bytes = len(self.table) * TranspositionTable.SLOT_BYTES
+            capacity = max(1, (self.max_memory - table_bytes) // NodePool.node_bytes(squares))
+            self.pool = NodePool(capacity, squares,
+                                 None if self.preallocate else self.INITIAL_NODES)
+            node = None
+        elif self.root_position is None:
+            node = None  # After new_game()
+        else:
+            node = self._find(pos)
+        if node is None:
+            self.pool.reset()
+        elif node != self.pool.root:
+            self.pool.advance(node)
+        self.root_position = pos.copy()
+
+    def _find(self, pos):
+        """Returns the node for pos in the tree, or None"""
+        root_pos = self.root_position
+        if pos == root_pos:
+            return self.pool.root
+        new = [i for i in range(len(pos.cells)) if pos.cells[i] != root_pos.cells[i]]
+        if (len(new) != pos.ply - root_pos.ply or len(new) > self.REUSE_PLIES
+                or any(root_pos.cells[i] != position.EMPTY for i in new)):
+            return None
+
+        # The new moves could have been played in more than one order, so
+        # try each order the tree knows about
+        pool = self.pool
+        stack = [(pool.root, root_pos)]
+        while stack:
+            (node, p) = stack.pop()
+            if p.ply == pos.ply:
+                if p == pos:
+                    return node
+                continue
+            for c in pool.children(node):
+                move = pool.move[c]
+                if move in new and pos.cells[move] == p.player and p.cells[move] == position.EMPTY:
+                    q = p.copy()
+                    q.play(move)
+                    stack.append((c, q))
+        return None
+
+    def _iterate(self, root_pos):
+        """Runs one select-expand-playout-backup iteration from root_pos.
+        Returns 1 if a playout was run, or 0 if the selection ended at a
+        finished game or the leaf was scored by the evaluator."""
+        pool = self.pool
+        visits = pool.visits
+        value = pool.value
+        child_count = pool.child_count
+        parent = pool.parent
+        table = self.table
+
+        # hashes[i] is the hash of the position i plies below the root, for
+        # the positions the transposition table keeps
+        pos = root_pos.copy()
+        node = pool.root
+        ply = 0
+        hashes = [pos.hash]
+        if visits[node] == 0:
+            self._from_table(node, pos)
+        while child_count[node]:
+            node = self._select(node)
+            pos.play(pool.move[node])
+            ply += 1
+            if ply <= self.TABLE_PLIES:
+                hashes.append(pos.hash)
+
+        # Leaves are only expanded on their second visit, which keeps the
+        # tree several times smaller for the same number of iterations
+        if pos.winner is None and (visits[node] or node == pool.root):
+            moves = pos.legal_moves()
+            if len(moves) <= pool.free():
+                self.random.shuffle(moves)
+                pool.expand(node, moves)
+                if ply < self.TABLE_PLIES:
+                    for c in pool.children(node):
+                        child = pos.copy()
+                        child.play(pool.move[c])
+                        self._from_table(c, child)
+                node = pool.first_child[node]
+                pos.play(pool.move[node])
+                ply += 1
+                if ply <= self.TABLE_PLIES:
+                    hashes.append(pos.hash)
+            else:
+                self._full = True
+
+        ran = 0
+        if pos.winner is not None:
+            result = pos.result(pos.player)
+        elif self.evaluator is not None and pos.depth == 2:
+            result = self.evaluator.evaluate(pos)
+        else:
+            result = self._playout(pos)
+            ran = 1
+
+        # result is from the point of view of the player to move at the leaf,
+        # and value[n] from the point of view of the player who moved into n,
+        # so it flips at each step back towards the root
+        while node >= 0:
+            result = -result
+            visits[node] += 1
+            value[node] += result
+            if ply < len(hashes):
+                table.add(hashes[ply], result)
+            node = parent[node]
+            ply -= 1
+        return ran
+
+    def _from_table(self, node, pos):
+        """Starts node, which hasn't been visited, from the transposition
+        table's results for its position pos, if it has any"""
+        entry = self.table.get(pos.hash)
+        if entry is not None:
+            (self.pool.visits[node], self.pool.value[node]) = entry
+
+    def _select(self, node):
+        pool = self.pool
+        visits = pool.visits
+        value = pool.value
+        first = pool.first_child[node]
+        best = first
+        best_score = -math.inf
+        log_visits = math.log(visits[node] + 1)
+        for c in range(first, first + pool.child_count[node]):
+            n = visits[c]
+            if n == 0:
+                return c  # Moves were shuffled when the node was expanded
+            score = value[c] / n + self.exploration * math.sqrt(log_visits / n)
+            if score > best_score:
+                best = c
+                best_score = score
+        return best
+
+    def _playout(self, pos):
+        """Plays random moves from pos until the game ends. Returns the result
+        for the player to move in pos."""
+        player = pos.player
+        rng = self.random
+        while pos.winner is None:
+            pos.play(pos.random_move(rng))
+        return pos.result(player)
+
+    def _result(self, iterations, ran, elapsed):
+        pool = self.pool
+        best = pool.best_child(pool.root)
+        if best is None or pool.visits[best] == 0:
+            return SearchResult(nodes=iterations, playouts=ran, elapsed=elapsed)
+
+        pv = []
+        node = best
+        while node is not None and pool.visits[node] and len(pv) < 20:
+            pv.append(pool.move[node])
+            node = pool.best_child(node)
+
+        return SearchResult(
+            bestmove=pool.move[best],
+            score=pool.value[best] / pool.visits[best],
+            nodes=iterations,
+            playouts=ran,
+            pv=pv,
+            elapsed=elapsed)
+
+
+class EngineProtocol(object):
+    """A line-based text protocol for driving an Engine from another process,
+    in the style of UCI. Commands read from input:
+
+        position startpos [moves <move> ...]
+        position <notation> [moves <move> ...]
+        go [movetime <ms>] [playouts <n>] [infinite]
+        stop
+        isready
+        newgame
+        quit
+
+    Positions and moves use the notation described in position.py. While
+    searching, "info" lines are written to output, followed by a single
+    "bestmove" line when the search finishes or is stopped. Commands other
+    than stop, isready and quit wait for a running search to finish first,
+    so a script of commands can be piped in; an infinite search is stopped
+    by the next such command."""
+
+    def __init__(self, engine, input=sys.stdin, output=sys.stdout):
+        self.engine = engine
+        self.input = input
+        self.output = output
+        self.position = position.from_notation(position.STARTPOS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._infinite = False
+
+    def send(self, line):
+        with self._lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self):
+        for line in self.input:
+            if not self.handle(line):
+                self.stop()
+                return
+        self.wait()
+
+    def handle(self, line):
+        """Handles a single command. Returns False if the engine should quit."""
+        words = line.split()
+        if not words:
+            return True
+        (command, args) = (words[0], words[1:])
+        try:
+            if "position" == command:
+                self.wait()
+                self.position = self.parse_position(args)
+            elif "go" == command:
+                self.wait()
+                self.go(args)
+            elif "stop" == command:
+                self.stop()
+            elif "isready" == command:
+                self.send("readyok")
+            elif "newgame" == command:
+                self.wait()
+                self.engine.new_game()
+            elif "quit" == command:
+                return False
+            else:
+                self.send("info string unknown command {}".format(command))
+        except ValueError as e:
+            self.send("info string error {}".format(e))
+        return True
+
+    @staticmethod
+    def parse_position(args):
+        """Returns the Position described by the arguments to a position
+        command. Raises ValueError if they are not valid."""
+        if "moves" in args:
+            split = args.index("moves")
+            (args, moves) = (args[:split], args[split + 1:])
+        else:
+            moves = []
+        if args == ["startpos"]:
+            pos = position.from_notation(position.STARTPOS)
+        else:
+            pos = position.from_notation(" ".join(args))
+        for text in moves:
+            move = position.from_move_notation(text, pos.depth)
+            if not pos.is_legal(move):
+                raise ValueError("Illegal move {}".format(text))
+            pos.play(move)
+        return pos
+
+    def go(self, args):
+        movetime = None
+        playouts = None
+        i = 0
+        while i < len(args):
+            if "movetime" == args[i] and i + 1 < len(args):
+                movetime = int(args[i + 1])
+                i += 2
+            elif "playouts" == args[i] and i + 1 < len(args):
+                playouts = int(args[i + 1])
+                i += 2
+            elif "infinite" == args[i]:
+                i += 1
+            else:
+                raise ValueError("Unexpected go argument {}".format(args[i]))
+
+        self._stop.clear()
+        self._infinite = movetime is None and playouts is None
+        pos = self.position.copy()
+
+        def info(result):
+            self.send_info(result, pos.depth)
+
+        def run():
+            result = self.engine.search(
+                pos, movetime, playouts, self._stop, info)
+            info(result)
+            if result.bestmove is None:
+                self.send("bestmove (none)")
+            else:
+                self.send("bestmove {}".format(
+                    position.to_move_notation(result.bestmove, pos.depth)))
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the running search, if any, and waits for its bestmove"""
+        self._stop.set()
+        self.wait()
+
+    def wait(self):
+        """Waits for the running search, if any, to finish. An infinite
+        search would never finish, so it is stopped."""
+        if self._thread is not None:
+            if self._infinite:
+                self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def send_info(self, result, depth=2):
+        self.send("info nodes {} playouts {} time {} score {:.3f} pv {}".format(
+            result.nodes,
+            result.playouts,
+            int(result.elapsed * 1000),
+            result.score,
+            " ".join(position.to_move_notation(m, depth) for m in result.pv)).rstrip())
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the engine, reading commands from stdin.")
+    parser.add_argument("--book", help="an opening book built with book.py")
+    parser.add_argument("--book-plies", type=int, help="plies to use the book for (default: all it covers)")
+    parser.add_argument("--weights", help="evaluator weights from train.py, used instead of playouts")
+    parser.add_argument("--memory", type=int, help="megabytes for the search tree (default: about 24)")
+    parser.add_argument("--preallocate", action="store_true",
+                        help="allocate the whole search tree at the start, rather than as it grows")
+    args = parser.parse_args(argv)
+
+    book = None
+    if args.book is not None:
+        from book import Book
+        book = Book(args.book)
+    evaluator = None
+    if args.weights is not None:
+        from evaluator import Evaluator
+        evaluator = Evaluator.load(args.weights)
+    max_memory = None if args.memory is None else args.memory * 1024 * 1024
+    EngineProtocol(Engine(book=book, book_plies=args.book_plies, evaluator=evaluator,
+                          preallocate=args.preallocate, max_memory=max_memory)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+import hashlib
+import math
+
+import numpy
+
+import position
+
+# A static evaluator for depth 2 positions, built from pattern tables: each
+# child board's nine squares (3 ** 9 patterns, with a separate table for each
+# of the nine boards) and the main board's nine results (4 ** 9 patterns, as
+# a drawn board is different from an open one) each index a weight. The
+# value of a position for X is tanh of the sum of its weights plus a tempo
+# weight for the player to move; train.py learns the weights by self-play.
+#
+# Weights are saved as float16, which is plenty for an evaluation:
+#
+#   MAGIC, then the child table (9 x 3 ** 9), the main board table (4 ** 9)
+#   and the tempo weight, little endian.
+
+MAGIC = b"UXOEVAL1"
+CHILD_PATTERNS = 3 ** 9
+MAIN_PATTERNS = 4 ** 9
+
+_CHILD_POWERS = 3 ** numpy.arange(9, dtype=numpy.int32)
+_MAIN_POWERS = 4 ** numpy.arange(9, dtype=numpy.int32)
+_BOARDS = numpy.arange(9)
+
+
+def encode(positions):
+    """Returns the features of a sequence of depth 2 positions as arrays:
+    child board pattern indices (n x 9), main board pattern indices (n) and
+    +1 or -1 for X or O to play (n)"""
+    count = len(positions)
+    cells = numpy.fromiter(
+        (s for p in positions for s in p.cells), dtype=numpy.int32, count=count * 81)
+    boards = numpy.fromiter(
+        (b for p in positions for b in p.boards), dtype=numpy.int32, count=count * 9)
+    side = numpy.fromiter(
+        (1 if p.player == position.X else -1 for p in positions), dtype=numpy.int32, count=count)
+    return (cells.reshape(count, 9, 9) @ _CHILD_POWERS,
+            boards.reshape(count, 9) @ _MAIN_POWERS,
+            side)
+
+
+class Evaluator(object):
+
+    def __init__(self, child=None, main=None, tempo=0.0):
+        if child is None:
+            child = numpy.zeros((9, CHILD_PATTERNS), dtype=numpy.float32)
+        if main is None:
+            main = numpy.zeros(MAIN_PATTERNS, dtype=numpy.float32)
+        self.child = child
+        self.main = main
+        self.tempo = float(tempo)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not an evaluator weights file".format(path))
+            weights = numpy.fromfile(f, dtype="<f2")
+        if len(weights) != 9 * CHILD_PATTERNS + MAIN_PATTERNS + 1:
+            raise ValueError("{} has the wrong number of weights".format(path))
+        weights = weights.astype(numpy.float32)
+        return Evaluator(
+            weights[:9 * CHILD_PATTERNS].reshape(9, CHILD_PATTERNS),
+            weights[9 * CHILD_PATTERNS:-1],
+            weights[-1])
+
+    def _weights(self):
+        """Returns the weights as they are saved"""
+        return numpy.concatenate((
+            self.child.ravel(),
+            self.main,
+            numpy.array([self.tempo], dtype=numpy.float32))).astype("<f2")
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            self._weights().tofile(f)
+
+    def digest(self):
+        """Returns a hex digest of the weights, as they would be saved"""
+        return hashlib.sha1(self._weights().tobytes()).hexdigest()
+
+    def values(self, child_index, main_index, side):
+        """Returns the value for X of each set of features from encode()"""
+        total = (self.child[_BOARDS, child_index].sum(axis=1)
+                 + self.main[main_index]
+                 + self.tempo * side)
+        return numpy.tanh(total)
+
+    def evaluate_batch(self, positions):
+        """Returns an array of the value of each of positions, in [-1, 1] for
+        the player to move, in one vectorised call"""
+        (child_index, main_index, side) = encode(positions)
+        return self.values(child_index, main_index, side) * side
+
+    def evaluate(self, pos):
+        """Returns the value of a single position in [-1, 1] for the player
+        to move. This avoids the overhead of building arrays for one
+        position, so it is the one to use inside a search."""
+        cells = pos.cells
+        total = 0.0
+        for b in range(9):
+            base = b * 9
+            index = 0
+            for s in range(8, -1, -1):
+                index = index * 3 + cells[base + s]
+            total += self.child[b, index]
+        index = 0
+        for b in range(8, -1, -1):
+            index = index * 4 + pos.boards[b]
+        total = float(total + self.main[index])
+        if pos.player == position.X:
+            return math.tanh(total + self.tempo)
+        return -math.tanh(total - self.tempo)
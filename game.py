@@ -1,9 +1,10 @@
 #!/usr/bin/python
 
 from enum import Enum
-from copy import copy
 import random
 
+import position
+
 class InvalidMoveException(Exception):
     pass
 
@@ -33,7 +34,6 @@ class Square(object):
 
 class Board(object):
     parent = None # this is currently unused
-    _index = 0
     _winner = None
     winning_line = None
 
@@ -53,15 +53,9 @@ class Board(object):
             self.parent = parent
 
     def __iter__(self):
-        return copy(self)
-
-    def __next__(self):
-        i = self._index
-        self._index = self._index + 1
-        if i < 9:
-            return self.square(i // 3, i % 3)
-        else:
-            raise StopIteration
+        # A generator rather than iterator state on the board, so that
+        # several threads can iterate over the same board at once
+        return (self.square(i // 3, i % 3) for i in range(9))
 
     def __getitem__(self, key):
         try:
@@ -250,14 +244,15 @@ class Move(object):
 
 class Game(object):
     last_move = None
-    _log_functions = []
-    moves = []
     
     # child_win and overall_win are flags that should be reset after they are read
     child_win = None # if not None, a tuple (child_board, winning_player)
     overall_win = None # if not None, the winning_player
 
-    def __init__(self, starting_player=None):
+    def __init__(self, starting_player=None, verbose=True):
+        self._log_functions = []
+        self.moves = []
+        self.verbose = verbose # if False, log_status doesn't print
         self.main_board = Board()
 
         for i in range(3):
@@ -287,7 +282,8 @@ class Game(object):
         self._log_functions.append(fun)
 
     def log_status(self, status):
-        print(status)
+        if self.verbose:
+            print(status)
         for f in self._log_functions:
             f(status)
 
@@ -309,12 +305,12 @@ class Game(object):
             Board.square_name(child_board)
             ))
 
-       #moves.append(Move(
-       #     self,
-       #     self.active_player,
-       #     child_board,
-       #     square
-       #     ))
+        self.moves.append(Move(
+            self,
+            self.active_player,
+            child_board,
+            square
+            ))
         
         # Check to see if this move resulted in child_board being won
         board_winner = self.main_board[child_board].child.winner()
@@ -364,3 +360,160 @@ class Game(object):
             if self.main_board[b].child.winner() is not None:
                 self.active_boards.remove(b)
         return self.active_boards
+
+class GameState(object):
+    """An immutable, hashable snapshot of a game. Unlike Game, a GameState can
+    be shared between threads and used as a dictionary key. play() returns a
+    new GameState which shares the eight unchanged child boards with this
+    one. Equal states have the same hash as the equivalent position.Position."""
+    __slots__ = ("boards", "results", "player", "forced", "winner", "_hash")
+
+    def __init__(self, boards, results, player, forced, winner, hash):
+        """Use from_game() or from_position() rather than calling this
+        directly. boards is a tuple of 9 child boards, each a tuple of 9 square
+        values (0 for empty, 1 for X, 2 for O), both in (row * 3 + col) order.
+        results holds the position.Position.boards value for each child
+        board, and forced is the (row, col) of the board which must be played
+        next, or None if any open board may be played."""
+        object.__setattr__(self, "boards", boards)
+        object.__setattr__(self, "results", results)
+        object.__setattr__(self, "player", player)
+        object.__setattr__(self, "forced", forced)
+        object.__setattr__(self, "winner", winner)
+        object.__setattr__(self, "_hash", hash)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GameState is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("GameState is immutable")
+
+    def __reduce__(self):
+        # The default for __slots__ would restore them with setattr
+        return (GameState, (self.boards, self.results, self.player, self.forced, self.winner, self._hash))
+
+    @staticmethod
+    def from_position(pos):
+        """Returns the GameState equivalent to a position.Position, which
+        must have the usual depth of 2"""
+        if pos.depth != 2:
+            raise ValueError("GameState only represents positions of depth 2")
+        cells = pos.cells
+        return GameState(
+            tuple(tuple(cells[b * 9:b * 9 + 9]) for b in range(9)),
+            tuple(pos.boards),
+            SquareState(pos.player),
+            None if pos.forced == position.ANY else divmod(pos.forced, 3),
+            None if pos.winner is None else SquareState(pos.winner),
+            pos.hash)
+
+    @staticmethod
+    def from_game(game):
+        """Returns a GameState with the same position as game"""
+        return GameState.from_position(position.Position.from_game(game))
+
+    @staticmethod
+    def new(starting_player=SquareState.X):
+        """Returns the state at the start of a game. starting_player may be
+        given as a SquareState or as 'x' or 'o'."""
+        if isinstance(starting_player, str):
+            starting_player = SquareState[starting_player]
+        return GameState.from_position(position.Position(starting_player.value))
+
+    def to_position(self):
+        """Returns a new position.Position for this state"""
+        cells = [value for board in self.boards for value in board]
+        forced = position.ANY if self.forced is None else self.forced[0] * 3 + self.forced[1]
+        return position.Position.from_cells(cells, self.player.value, forced)
+
+    def to_game(self, verbose=False):
+        """Returns a new Game in this state. The Game has no record of the
+        moves that led here."""
+        game = Game(self.player, verbose)
+        for b in range(9):
+            square = game.main_board.square(b // 3, b % 3)
+            for s in range(9):
+                square.child.square(s // 3, s % 3).state = SquareState(self.boards[b][s])
+            if self.results[b] in (position.X, position.O):
+                square.child.winner()  # Sets winning_line
+                square.state = SquareState(self.results[b])
+        if self.winner is not None:
+            if self.winner != SquareState.empty:
+                game.main_board.winner()  # Sets winning_line
+            game.overall_win = self.winner
+            # So that available_boards() offers nothing
+            game.last_move = None
+            game.active_boards = []
+        else:
+            game.last_move = self.forced
+            game.active_boards = [(b // 3, b % 3) for b in range(9) if self.results[b] == position.EMPTY]
+        return game
+
+    def square(self, child_board, square):
+        """Returns the SquareState of square in child_board, each given as
+        (row, col) tuples"""
+        return SquareState(self.boards[child_board[0] * 3 + child_board[1]][square[0] * 3 + square[1]])
+
+    def available_boards(self):
+        """Returns the child boards which may be played on next, as (row, col)
+        tuples, following the same rules as Game.available_boards()"""
+        if self.winner is not None:
+            return []
+        if self.forced is not None:
+            return [self.forced]
+        return [(b // 3, b % 3) for b in range(9) if self.results[b] == position.EMPTY]
+
+    def play(self, child_board, square):
+        """Returns the state after self.player plays on square in child_board.
+        Each of child_board and square to be specified as (row, col) tuples.
+        Raises InvalidMoveException if the move is not allowed."""
+        try:
+            ((row, col), (square_row, square_col)) = (child_board, square)
+        except (TypeError, ValueError):
+            raise InvalidMoveException
+        if any(x not in range(3) for x in (row, col, square_row, square_col)):
+            raise InvalidMoveException
+        b = row * 3 + col
+        s = square_row * 3 + square_col
+        occupied = self.boards[b][s] != position.EMPTY
+        if (self.winner is not None or occupied
+                or self.results[b] != position.EMPTY
+                or self.forced not in (None, (b // 3, b % 3))):
+            raise InvalidMoveException
+
+        player = self.player.value
+        board = self.boards[b][:s] + (player,) + self.boards[b][s + 1:]
+        boards = self.boards[:b] + (board,) + self.boards[b + 1:]
+
+        results = self.results
+        winner = None
+        if position.has_line(board, 0, s, player):
+            results = results[:b] + (player,) + results[b + 1:]
+            if position.has_line(results, 0, b, player):
+                winner = self.player
+        elif position.EMPTY not in board:
+            results = results[:b] + (position.DRAWN,) + results[b + 1:]
+        if winner is None and position.EMPTY not in results:
+            winner = SquareState.empty
+
+        forced = (s // 3, s % 3) if results[s] == position.EMPTY else None
+        hash = (self._hash
+                ^ position.SQUARE_KEYS[(b * 9 + s) * 2 + player - 1]
+                ^ position.FORCED_KEYS[0 if self.forced is None else self.forced[0] * 3 + self.forced[1] + 1]
+                ^ position.FORCED_KEYS[0 if forced is None else s + 1]
+                ^ position.SIDE_KEY)
+        next_player = SquareState.O if self.player == SquareState.X else SquareState.X
+        return GameState(boards, results, next_player, forced, winner, hash)
+
+    def __eq__(self, other):
+        return (isinstance(other, GameState)
+                and self._hash == other._hash
+                and self.player == other.player
+                and self.forced == other.forced
+                and self.boards == other.boards)
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return "GameState({!r})".format(str(self.to_position()))
@@ -1,7 +1,12 @@
 #!/usr/bin/python
 
-import tkinter
-from tkinter import N, S, E, W, ttk, messagebox
+import uuid
+
+import position
+
+# CanvasHelper only calls methods on the canvas it is given, so it doesn't
+# import tkinter, and render.py can draw with it without a display. Cap
+# styles are given as the strings tkinter's constants stand for.
 
 
 class CanvasHelper(object):
@@ -10,7 +15,7 @@ class CanvasHelper(object):
         pass
 
     @staticmethod
-    def draw_grid(canvas, colour="black", thickness=2, rows=3, cols=3, outer=False, caps=tkinter.PROJECTING, tags=()):
+    def draw_grid(canvas, colour="black", thickness=2, rows=3, cols=3, outer=False, caps="projecting", tags=()):
         """Draws a grid with the specified number of rows and columns on the
         gameboard with the specified colour and line thickness. Each line of the
         grid is tagged with 'resize', 'grid' and anything specified in tags.
@@ -182,7 +187,7 @@ class CanvasHelper(object):
             bbox[3],
             fill="blue",
             width=thickness,
-            capstyle=tkinter.ROUND,
+            capstyle="round",
             tag=("resize", "x") + tags)
         canvas.create_line(
             bbox[0],
@@ -191,14 +196,16 @@ class CanvasHelper(object):
             bbox[1],
             fill="blue",
             width=thickness,
-            capstyle=tkinter.ROUND,
+            capstyle="round",
             tag=("resize", "x") + tags)
 
     @staticmethod
-    def higlight_available_boards(canvas, available_boards):
+    def higlight_available_boards(canvas, available_boards, rows=3):
+        """Highlights each of available_boards, given as (row, col) on the
+        gameboard divided into rows rows and columns"""
         canvas.delete("available")
         for b in available_boards:
-            bbox = CanvasHelper.get_bbox(canvas, b[0], b[1], 3, 3)
+            bbox = CanvasHelper.get_bbox(canvas, b[0], b[1], rows, rows)
             canvas.create_rectangle(
                 bbox[0],
                 bbox[1],
@@ -210,3 +217,104 @@ class CanvasHelper(object):
                 tags=("resize", "available")
                 )
         canvas.tag_lower("available", "grid")
+
+    @staticmethod
+    def draw_nested_grid(canvas, depth=2):
+        """Draws the grids for a gameboard nested depth levels deep (so with
+        3 ** depth rows and columns), with lines getting thicker towards the
+        top level. Each grid is tagged 'grid-<level>', and the finest and
+        coarsest are also tagged 'minor-grid' and 'major-grid'."""
+        for level in range(depth):
+            rows = 3 ** (depth - level)
+            tags = ("grid-{}".format(level),)
+            if 0 == level:
+                tags = tags + ("minor-grid",)
+            if depth - 1 == level:
+                tags = tags + ("major-grid",)
+            CanvasHelper.draw_grid(
+                canvas,
+                colour="#999" if 0 == level else "black",
+                thickness=level + 1,
+                rows=rows,
+                cols=rows,
+                tags=tags)
+
+    @staticmethod
+    def draw_win_line(canvas, row, col, rows, winning_line, thickness=5):
+        """Draws a line through winning_line, a pair of (row, col) squares
+        within the board at row, col on the gameboard divided into rows rows
+        and columns. The line is extended a little past the centre of each
+        end square."""
+        start_delta = CanvasHelper.get_midpoint(
+            canvas, winning_line[0][0], winning_line[0][1], rows * 3, rows * 3)
+        end_delta = CanvasHelper.get_midpoint(
+            canvas, winning_line[1][0], winning_line[1][1], rows * 3, rows * 3)
+        start_point = CanvasHelper.get_bbox(canvas, row, col, rows, rows)
+        line = (
+                start_point[0] + start_delta[0],
+                start_point[1] + start_delta[1],
+                start_point[0] + end_delta[0],
+                start_point[1] + end_delta[1])
+        extension = (
+                1.1 * (line[2] - line[0]) / 8,
+                1.1 * (line[3] - line[1]) / 8)
+        canvas.create_line(
+            line[0] - extension[0],
+            line[1] - extension[1],
+            line[2] + extension[0],
+            line[3] + extension[1],
+            fill="black",
+            width=thickness,
+            capstyle="round",
+            tag=("resize", "win-line"))
+
+    @staticmethod
+    def draw_position(canvas, pos):
+        """Clears the canvas and draws pos (a position.Position of any depth):
+        the grids, every X and O, a line and a big X or O over each board that
+        has been won at any level, and a highlight over where the next move
+        may be played. Line thicknesses scale with the size of the squares, so
+        this works for grids of any size."""
+        canvas.delete("all")
+        depth = pos.depth
+        CanvasHelper.draw_nested_grid(canvas, depth)
+        extent = min(canvas.winfo_width(), canvas.winfo_height())
+
+        for level in range(depth + 1):
+            if level < depth:
+                states = pos.levels[level]
+            else:
+                states = [position.EMPTY if pos.winner is None else pos.winner]
+            rows = 3 ** (depth - level)
+            box = extent / rows
+            for i in range(len(states)):
+                state = states[i]
+                if state not in (position.X, position.O):
+                    continue
+                (row, col) = position.grid_coordinates(i, depth - level)
+                if 0 == level:
+                    (thickness, size) = (max(1, box * 0.09), 0.5)
+                else:
+                    (thickness, size) = (max(1, box * 0.06), 0.75)
+                    (a, b) = position.winning_line(pos.levels[level - 1], i * 9)
+                    CanvasHelper.draw_win_line(
+                        canvas, row, col, rows,
+                        ((a // 3, a % 3), (b // 3, b % 3)),
+                        max(1, box * 0.03))
+                if position.X == state:
+                    CanvasHelper.draw_x(canvas, row, col, rows, rows, thickness, size)
+                else:
+                    CanvasHelper.draw_o(canvas, row, col, rows, rows, thickness, size)
+
+        if pos.winner is None:
+            (level, board) = pos.region()
+            if level == depth:
+                # Any open top level board may be played
+                level = depth - 1
+                boards = [b for b in range(9) if pos.levels[level][b] == position.EMPTY]
+            else:
+                boards = [board]
+            CanvasHelper.higlight_available_boards(
+                canvas,
+                [position.grid_coordinates(b, depth - level) for b in boards],
+                3 ** (depth - level))
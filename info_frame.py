@@ -1,11 +1,141 @@
 #!/usr/bin/python
 
 import tkinter
+import tkinter.font
 from tkinter import N, S, E, W, ttk, messagebox
 
+
+class MoveHistory(ttk.Frame):
+    """A scrolling list of moves which only draws the rows that are visible,
+    so it stays quick however many entries it has. Adding, removing or
+    selecting an entry just moves the few text items on screen."""
+
+    def __init__(self, parent, on_select=None, rows=8, *args, **kwargs):
+        """on_select, if given, is called with the index of a row when it is
+        clicked"""
+        ttk.Frame.__init__(self, parent, *args, **kwargs)
+        self.on_select = on_select
+        self.entries = []
+        self.current = None # index of the highlighted entry
+        self.top = 0 # index of the first visible entry
+
+        font = tkinter.font.nametofont("TkDefaultFont")
+        self.row_height = font.metrics("linespace") + 2
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.canvas = tkinter.Canvas(
+            self,
+            height=rows * self.row_height,
+            bg="white",
+            highlightthickness=0)
+        self.canvas.grid(column=0, row=0, sticky=(N, S, E, W))
+        self.scrollbar = ttk.Scrollbar(self, orient=tkinter.VERTICAL, command=self.yview)
+        self.scrollbar.grid(column=1, row=0, sticky=(N, S))
+
+        self._highlight = self.canvas.create_rectangle(
+            0, 0, 0, 0, fill="#dde4ff", width=0, state=tkinter.HIDDEN)
+        self._items = [] # one text item per visible row, reused as we scroll
+
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        self.canvas.bind("<Button-1>", self.onclick)
+        self.canvas.bind("<MouseWheel>", lambda e: self.yview("scroll", -e.delta // 120, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self.yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.yview("scroll", 1, "units"))
+
+    def visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def _at_end(self):
+        return self.top + self.visible_rows() >= len(self.entries)
+
+    def _clamp(self):
+        self.top = max(0, min(self.top, len(self.entries) - self.visible_rows()))
+
+    def render(self):
+        """Redraws the visible rows and updates the scrollbar"""
+        rows = self.visible_rows()
+        width = self.canvas.winfo_width()
+        while len(self._items) < rows:
+            self._items.append(self.canvas.create_text(0, 0, anchor=W))
+        for (k, item) in enumerate(self._items):
+            i = self.top + k
+            if k < rows and i < len(self.entries):
+                self.canvas.itemconfigure(item, text=self.entries[i], state=tkinter.NORMAL)
+                self.canvas.coords(item, 4, (k + 0.5) * self.row_height)
+            else:
+                self.canvas.itemconfigure(item, state=tkinter.HIDDEN)
+
+        if self.current is not None and self.top <= self.current < self.top + rows:
+            y = (self.current - self.top) * self.row_height
+            self.canvas.coords(self._highlight, 0, y, width, y + self.row_height)
+            self.canvas.itemconfigure(self._highlight, state=tkinter.NORMAL)
+        else:
+            self.canvas.itemconfigure(self._highlight, state=tkinter.HIDDEN)
+
+        if self.entries:
+            self.scrollbar.set(
+                self.top / len(self.entries),
+                min(1, (self.top + rows) / len(self.entries)))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def yview(self, *args):
+        """Scrolls in response to the scrollbar, in the same way as
+        tkinter.Canvas.yview"""
+        if "moveto" == args[0]:
+            self.top = int(float(args[1]) * len(self.entries))
+        elif "scroll" == args[0]:
+            amount = int(args[1])
+            if "pages" == args[2]:
+                amount = amount * self.visible_rows()
+            self.top = self.top + amount
+        self._clamp()
+        self.render()
+
+    def onclick(self, e):
+        i = self.top + e.y // self.row_height
+        if i < len(self.entries) and self.on_select is not None:
+            self.on_select(i)
+
+    def append(self, text):
+        """Adds a row to the end of the list. If the end of the list was in
+        view, it scrolls to keep it in view."""
+        self.extend((text,))
+
+    def extend(self, texts):
+        """Adds several rows to the end of the list at once"""
+        follow = self._at_end()
+        self.entries.extend(texts)
+        if follow:
+            self.top = len(self.entries)
+            self._clamp()
+        self.render()
+
+    def truncate(self, count):
+        """Removes all but the first count rows"""
+        del self.entries[count:]
+        if self.current is not None and self.current >= count:
+            self.current = None
+        self._clamp()
+        self.render()
+
+    def select(self, index):
+        """Highlights the row at index, scrolling it into view if needed"""
+        self.current = index
+        rows = self.visible_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + rows:
+            self.top = index - rows + 1
+        self._clamp()
+        self.render()
+
 class InfoFrame(tkinter.Frame):
 
-    def __init__(self, parent, game, start_game, *args, **kwargs):
+    def __init__(self, parent, game, start_game, on_select=None, *args, **kwargs):
+        """on_select is called with the index of a move in the history when
+        it is clicked"""
         ttk.Frame.__init__(self, parent, *args, **kwargs)
         self.columnconfigure(1, weight=1)
         self.columnconfigure(2, weight=1)
@@ -32,6 +162,11 @@ class InfoFrame(tkinter.Frame):
             column=1, columnspan=3, row=2, #1,
             sticky=(N, S, E, W), pady=10)
 
+        self.history = MoveHistory(self, on_select=on_select)
+        self.history.grid(
+            column=1, columnspan=3, row=3,
+            sticky=(N, S, E, W))
+
         # self.X_name = tkinter.StringVar()
         # ttk.Label(
         #     self,
@@ -1,16 +1,25 @@
 #!/usr/bin/python
 
+import argparse
+import atexit
+import sqlite3
 import tkinter
-import random
-import uuid
 from tkinter import N, S, E, W, ttk, messagebox
 
+import cache
 import game
 import menu
 import info_frame
+import position
+from engine import Engine
 from gameboard import CanvasHelper
+from position import Position
 from tkutils import ResizingCanvas, set_aspect
 
+# The engine's search budget for the computer player
+COMPUTER_PLAYOUTS = 2000
+
+
 class MainWindow(ttk.Frame):
 
     def gameboard_onclick(self, e):
@@ -19,58 +28,67 @@ class MainWindow(ttk.Frame):
         the user."""
         try:
             (row, col) = CanvasHelper.get_square(self.gameboard, e.x, e.y)
-            (outer_row, outer_col, inner_row, inner_col) = (row // 3, col // 3, row % 3, col % 3)
-            self.game.play((outer_row, outer_col), (inner_row, inner_col))
-            # self.set_status("Played at ({}, {}), ({}, {})".format(outer_row, outer_col, inner_row, inner_col))
-
-            # That self.game.play(...) has changed self.game.active_player so
-            # this is backwards
-            if self.game.active_player == game.SquareState.X:
-                CanvasHelper.draw_o(self.gameboard, row, col)
-            else:
-                CanvasHelper.draw_x(self.gameboard, row, col)
-
-            if self.game.child_win is not None:
-                self.game_onchildwin(self.game.child_win[0], self.game.child_win[1])
-                self.game.child_win = None
-
-            if self.game.overall_win is not None:
-                CanvasHelper.higlight_available_boards(self.gameboard, ())
-            else:
-                CanvasHelper.higlight_available_boards(self.gameboard, self.game.available_boards())
+            self.play((row // 3, col // 3), (row % 3, col % 3))
 
         except game.InvalidMoveException:
-            # self.set_status("({}, {}), ({}, {}) is an invalid move".format(outer_row, outer_col, inner_row, inner_col))
             pass
 
         except CanvasHelper.OnGridException:
             pass
 
+    def play(self, child_board, square):
+        """Plays square of child_board, both (row, col), and updates the
+        gameboard and move history. Raises game.InvalidMoveException if the
+        move isn't allowed."""
+        (outer_row, outer_col) = child_board
+        (inner_row, inner_col) = square
+        (row, col) = (outer_row * 3 + inner_row, outer_col * 3 + inner_col)
+        self.game.play((outer_row, outer_col), (inner_row, inner_col))
+
+        # That self.game.play(...) has changed self.game.active_player so
+        # this is backwards
+        if self.game.active_player == game.SquareState.X:
+            CanvasHelper.draw_o(self.gameboard, row, col)
+        else:
+            CanvasHelper.draw_x(self.gameboard, row, col)
+
+        if self.game.child_win is not None:
+            self.game_onchildwin(self.game.child_win[0], self.game.child_win[1])
+            self.game.child_win = None
+
+        if self.game.overall_win is not None:
+            CanvasHelper.higlight_available_boards(self.gameboard, ())
+        else:
+            CanvasHelper.higlight_available_boards(self.gameboard, self.game.available_boards())
+
+        self.record_move((outer_row, outer_col), (inner_row, inner_col))
+
+    def computer_move(self):
+        """Plays the engine's choice of move for the player to move. The
+        analysis cache is checked first, and the engine only searches
+        positions it hasn't seen with the same budget."""
+        if self.game.overall_win is not None:
+            return
+        pos = Position.from_game(self.game)
+        budget = cache.budget(playouts=COMPUTER_PLAYOUTS)
+        result = None
+        if self.analysis_cache is not None:
+            result = self.analysis_cache.get(pos, budget)
+        if result is None:
+            self.set_status("Thinking...")
+            self.update_idletasks()
+            result = self.engine.search(pos, playouts=COMPUTER_PLAYOUTS)
+            if self.analysis_cache is not None:
+                self.analysis_cache.put(pos, budget, result)
+        (child_board, square) = position.to_move_coordinates(result.bestmove)
+        self.play(child_board, square)
+
     def game_onchildwin(self, board, player):
         """Called when a child board is won"""
 
         # Draw a line through the winning location
         winning_line = self.game.main_board[board].child.winning_line
-        start_delta = CanvasHelper.get_midpoint(self.gameboard, winning_line[0][0], winning_line[0][1])
-        end_delta = CanvasHelper.get_midpoint(self.gameboard, winning_line[1][0], winning_line[1][1])
-        start_point = CanvasHelper.get_bbox(self.gameboard, board[0], board[1], 3, 3)
-        line = (
-                start_point[0] + start_delta[0],
-                start_point[1] + start_delta[1],
-                start_point[0] + end_delta[0],
-                start_point[1] + end_delta[1])
-        extension = (
-                1.1 * (line[2] - line[0]) / 8,
-                1.1 * (line[3] - line[1]) / 8)
-        self.gameboard.create_line(
-            line[0] - extension[0],
-            line[1] - extension[1],
-            line[2] + extension[0],
-            line[3] + extension[1],
-            fill="black",
-            width=5,
-            capstyle=tkinter.ROUND,
-            tag=("resize",))
+        CanvasHelper.draw_win_line(self.gameboard, board[0], board[1], 3, winning_line)
 
         # Draw a big X or O over the square they won
         if player == game.SquareState.X:
@@ -82,6 +100,48 @@ class MainWindow(ttk.Frame):
     def set_status(self, t):
         self.infoframe.status.config(text=t)
 
+    def record_move(self, child_board, square):
+        """Adds the move just played to the move history. If we had jumped
+        back to an earlier move, the moves after it are forgotten first."""
+        n = len(self.game.moves)
+        del self.moves[n - 1:]
+        self.moves.append((child_board, square))
+        history = self.infoframe.history
+        history.truncate(n)
+        history.append("{}. {}".format(n, self.game.moves[-1]))
+        history.select(n)
+
+    def jump_to(self, index):
+        """Shows the game as it was after the first index moves in the move
+        history. Playing a move from there starts a new line of play."""
+        g = game.Game(self.starting_player, verbose=False)
+        for (child_board, square) in self.moves[:index]:
+            g.play(child_board, square)
+        g.verbose = True
+        g.child_win = None
+        g.add_log_function(self.set_status)
+        self.game = g
+        self.redraw()
+        self.infoframe.history.select(index)
+        self.set_status("{} to play".format(g.active_player.name))
+
+    def new_game(self, g):
+        """Replaces the current game with g, which has not started yet"""
+        self.game = g
+        self.starting_player = g.active_player
+        self.moves = [] # (child_board, square) for each move in the history
+        g.add_log_function(self.set_status)
+        history = self.infoframe.history
+        history.truncate(0)
+        history.append("Start: {} to play".format(g.active_player.name))
+        history.select(0)
+        self.redraw()
+        self.set_status("{} to play".format(g.active_player.name))
+
+    def redraw(self):
+        """Clears the gameboard and draws the current game from scratch"""
+        CanvasHelper.draw_position(self.gameboard, Position.from_game(self.game))
+
     # def start_game(self):
     #     if "" == self.infoframe.X_name.get().strip():
     #         self.infoframe.X_name.set("X")
@@ -91,16 +151,18 @@ class MainWindow(ttk.Frame):
     #     self.infoframe.O_entry.config(state=tkinter.DISABLED)
     #     self.set_status("{} to play".format(self.game.active_player.name))
 
-    def __init__(self, parent, game, *args, **kwargs):
+    def __init__(self, parent, game, engine=None, analysis_cache=None, *args, **kwargs):
         ttk.Frame.__init__(self, parent, padding=20, *args, **kwargs)
         self.parent = parent
         self.game = game
+        self.engine = engine or Engine()
+        self.analysis_cache = analysis_cache  # A cache.AnalysisCache, or None
 
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
         self.rowconfigure(1, weight=0)
 
-        self.infoframe = info_frame.InfoFrame(self, game, start_game=None) #self.start_game)
+        self.infoframe = info_frame.InfoFrame(self, game, start_game=None, on_select=self.jump_to) #self.start_game)
         self.infoframe.grid(column=0, row=1, sticky=(N, W, E, S))
 
         # We set up an auto-resizing, fixed-aspect-ratio frame which will
@@ -120,35 +182,40 @@ class MainWindow(ttk.Frame):
         # We need to update the root window to make sure we have the right
         # dimensions before we can draw the grids
         self.parent.update()
-        CanvasHelper.draw_grid(self.gameboard, colour="#999", thickness=1, rows=9, cols=9, tags=("minor-grid",))
-        CanvasHelper.draw_grid(self.gameboard, tags=("major-grid",))
 
         # Create the click binding for the gameboard
         self.gameboard.bind("<Button-1>", self.gameboard_onclick)
 
-        # Highlight all available boards
-        CanvasHelper.higlight_available_boards(self.gameboard, self.game.available_boards())
-
-        # Display status
-        def log_func(status):
-            self.set_status(status)
-        self.game.add_log_function(log_func)
+        # Draws the grid, highlights all available boards, starts the move
+        # history and sets the status
+        self.new_game(game)
 
-        # Set status
-        self.set_status("{} to play".format(self.game.active_player.name))
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play ultimate noughts and crosses.")
+    parser.parse_args(argv)
 
-if __name__ == "__main__":
     root = tkinter.Tk()
     root.title("Ultimate XO")
     root.columnconfigure(0, weight=1)
     root.rowconfigure(0, weight=1)
 
+    engine = Engine()
+    try:
+        analysis_cache = cache.AnalysisCache(version=engine.version())
+        atexit.register(analysis_cache.close)
+    except (OSError, sqlite3.Error):
+        analysis_cache = None  # The computer player works without it, just slower
+
     g = game.Game()
 
-    main_window = MainWindow(root, g)
+    main_window = MainWindow(root, g, engine, analysis_cache)
     main_window.grid(column=0, row=0, sticky=(N, W, E, S))
     root.config(menu=menu.MainMenu(root, g, main_window))
 
     root.update()
     root.minsize(root.winfo_width(), root.winfo_height())
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
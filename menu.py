@@ -20,6 +20,13 @@ class MainMenu(tkinter.Menu):
             accelerator="Ctrl+N")
         root.bind_all("<Control-n>", self.new_game)
 
+        gamemenu.add_command(
+            label="Computer move",
+            command=self.computer_move,
+            underline=0,
+            accelerator="Ctrl+M")
+        root.bind_all("<Control-m>", self.computer_move)
+
         # gamemenu.add_command(
         #     label="Undo",
         #     command=self.undo,
@@ -42,11 +49,13 @@ class MainMenu(tkinter.Menu):
             "Are you sure you want to start a new game?",
             icon="warning")
         if "yes" == confirm:
-            self.main_window.clear_board()
             g = game.Game()
-            self.main_window.game = g
+            self.main_window.new_game(g)
             self.game = g
 
+    def computer_move(self, e=None):
+        self.main_window.computer_move()
+
     def undo(self, e=None):
         print("Undo: {}".format(e))
         pass
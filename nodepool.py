@@ -0,0 +1,227 @@
+#!/usr/bin/python
+
+from array import array
+
+
+class NodePool(object):
+    """A search tree stored in preallocated parallel arrays, one entry per
+    node, rather than as one Python object per node, so the tree can grow to
+    millions of nodes without the garbage collector noticing. Nothing is
+    allocated once the arrays have room for capacity nodes. A pool can also
+    start smaller, and double the length of its arrays as the tree grows up
+    to capacity, so that short searches don't pay to allocate the memory a
+    long one would need.
+
+    The children of a node are allocated together, so they are the
+    child_count[n] entries starting at first_child[n]. value[n] is the sum of
+    the results of the visits to n, from the point of view of the player who
+    moved into n. Children are always allocated after their parent, so a
+    node's index is always greater than its parent's; compact() relies on
+    this."""
+
+    class PoolFull(Exception):
+        pass
+
+    def __init__(self, capacity, squares=81, initial=None):
+        """initial is the number of nodes to make room for straight away; by
+        default, all of capacity"""
+        self.capacity = capacity
+        self.squares = squares
+        self.visits = array("I")
+        self.value = array("f")
+        self.first_child = array("i")
+        self.child_count = array("I")
+        self.parent = array("i")
+        self._forward = array("i")  # Scratch space for compact()
+        self.move = array("B" if squares <= 0x100 else "I")
+        self.allocated = 0  # The length of each array
+        self._grow(capacity if initial is None else min(capacity, initial))
+        self.reset()
+
+    @staticmethod
+    def node_bytes(squares=81):
+        """Returns the bytes used per node by a pool for positions with
+        squares squares, for sizing pools from a memory budget"""
+        return 4 + 4 + 4 + 4 + 4 + 4 + (1 if squares <= 0x100 else 4)
+
+    def _grow(self, count):
+        """Lengthens the arrays to hold at least count nodes"""
+        length = min(self.capacity, max(count, 2 * self.allocated))
+        extra = length - self.allocated
+        for a in (self.visits, self.value, self.first_child, self.child_count,
+                  self.parent, self._forward, self.move):
+            a.frombytes(bytes(a.itemsize * extra))
+        self.allocated = length
+
+    def reset(self):
+        """Empties the pool, leaving just a root node"""
+        self.size = 0
+        self.root = self._allocate(1)
+        self.parent[self.root] = -1
+        self.move[self.root] = 0
+
+    def _allocate(self, count):
+        start = self.size
+        if start + count > self.allocated:
+            if start + count > self.capacity:
+                raise NodePool.PoolFull()
+            self._grow(start + count)
+        for i in range(start, start + count):
+            self.visits[i] = 0
+            self.value[i] = 0.0
+            self.first_child[i] = -1
+            self.child_count[i] = 0
+        self.size = start + count
+        return start
+
+    def free(self):
+        return self.capacity - self.size
+
+    def expand(self, node, moves):
+        """Adds a child of node for each of moves. Raises NodePool.PoolFull
+        if there isn't room."""
+        first = self._allocate(len(moves))
+        for (i, move) in enumerate(moves):
+            self.move[first + i] = move
+            self.parent[first + i] = node
+        self.first_child[node] = first
+        self.child_count[node] = len(moves)
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node])
+
+    def child(self, node, move):
+        """Returns the child of node reached by move, or None"""
+        for c in self.children(node):
+            if self.move[c] == move:
+                return c
+        return None
+
+    def advance(self, node):
+        """Makes node, a descendant of the root, the new root, discarding the
+        rest of the tree and compacting what is left to the start of the
+        pool"""
+        self.compact(node)
+
+    def compact(self, root=None):
+        """Moves every node reachable from root (by default, the current root)
+        to the start of the pool, in the same order, and makes it the root.
+        Nodes whose parent has no children any more (see prune()) are
+        discarded along with their own descendants."""
+        if root is None:
+            root = self.root
+        visits = self.visits
+        value = self.value
+        first_child = self.first_child
+        child_count = self.child_count
+        parent = self.parent
+        move = self.move
+        forward = self._forward
+
+        # Children come after their parents, so one pass in index order finds
+        # every reachable node and where it will move to
+        size = 0
+        for i in range(root, self.size):
+            p = parent[i]
+            if i == root or (p >= root and forward[p] >= 0 and child_count[p] > 0):
+                forward[i] = size
+                size += 1
+            else:
+                forward[i] = -1
+
+        # Every node moves to an index no greater than its own, so copying in
+        # index order never overwrites a node that hasn't been copied yet
+        for i in range(root, self.size):
+            f = forward[i]
+            if f < 0:
+                continue
+            visits[f] = visits[i]
+            value[f] = value[i]
+            move[f] = move[i]
+            count = child_count[i]
+            child_count[f] = count
+            first_child[f] = forward[first_child[i]] if count else -1
+            parent[f] = -1 if i == root else forward[parent[i]]
+        self.size = size
+        self.root = 0
+
+    def prune(self, target):
+        """Frees space until at most target nodes are in use by discarding
+        the children of the least visited nodes. The root and its children are
+        always kept."""
+        visits = self.visits
+        child_count = self.child_count
+        first_child = self.first_child
+        threshold = 1
+        # Once threshold passes the most visits of any node, everything but
+        # the root's children has been discarded. (Usually that is the root,
+        # but nodes started from a transposition table can have more.)
+        most = max(visits[self.root:self.size])
+        while self.size > target and threshold <= 2 * most:
+            root = self.root
+            for i in range(root + 1, self.size):
+                if child_count[i] and visits[i] <= threshold:
+                    child_count[i] = 0
+                    first_child[i] = -1
+            self.compact()
+            threshold *= 2
+
+    def best_child(self, node):
+        """Returns the most visited child of node, or None"""
+        best = None
+        most = -1
+        visits = self.visits
+        for c in self.children(node):
+            if visits[c] > most:
+                best = c
+                most = visits[c]
+        return best
+
+
+class TranspositionTable(object):
+    """Search results (visits and value, as for NodePool) by position hash,
+    in fixed-size parallel arrays rather than a dictionary, so its memory use
+    is set when it is created and the garbage collector never sees it. Each
+    hash has a single slot, hash & mask, and a new position always replaces
+    whatever was in its slot."""
+
+    # Bytes used per slot
+    SLOT_BYTES = 8 + 4 + 4
+
+    def __init__(self, slots):
+        """slots is rounded down to a power of two"""
+        size = 1
+        while size * 2 <= slots:
+            size *= 2
+        self.mask = size - 1
+        self.keys = array("Q", bytes(8 * size))
+        self.visits = array("I", bytes(4 * size))
+        self.value = array("f", bytes(4 * size))
+
+    def __len__(self):
+        return self.mask + 1
+
+    def clear(self):
+        size = self.mask + 1
+        self.keys = array("Q", bytes(8 * size))
+        self.visits = array("I", bytes(4 * size))
+        self.value = array("f", bytes(4 * size))
+
+    def get(self, hash):
+        """Returns (visits, value) for the position with hash, or None"""
+        i = hash & self.mask
+        if self.keys[i] != hash or not self.visits[i]:
+            return None
+        return (self.visits[i], self.value[i])
+
+    def add(self, hash, result):
+        """Adds a visit with result to the position with hash"""
+        i = hash & self.mask
+        if self.keys[i] != hash or not self.visits[i]:
+            self.keys[i] = hash
+            self.visits[i] = 1
+            self.value[i] = result
+        else:
+            self.visits[i] += 1
+            self.value[i] += result
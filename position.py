@@ -0,0 +1,653 @@
+#!/usr/bin/python
+
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+# A Position is a compact, mutable copy of the state of a game, intended for
+# engines and analysis tools which need to play and copy many thousands of
+# positions a second. Game is still the model used by the GUI.
+#
+# Positions can be nested to any depth: depth 2 is ordinary ultimate noughts
+# and crosses on a 9x9 grid, depth 3 is "ultimate ultimate" on a 27x27 grid,
+# and so on. The state of each level of boards is kept in its own flat list,
+# levels[0] being the squares and levels[depth - 1] the top level boards; the
+# result of the whole game is Position.winner.
+#
+# Squares are numbered in board-major order, with one base 9 digit for each
+# level from the top down, each digit being row * 3 + col in the same
+# addressing used by Board.square(). So at depth 2, square s of child board b
+# has index b * 9 + s. The board at level l containing square i has index
+# i // 9 ** l in levels[l].
+
+EMPTY = 0
+X = 1
+O = 2
+DRAWN = 3  # Only used for boards
+ANY = -1  # No forced board: play on any open board
+
+LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),  # rows
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),  # columns
+    (0, 4, 8), (2, 4, 6))  # diagonals
+LINES_THROUGH = tuple(
+    tuple(line for line in LINES if s in line) for s in range(9))
+
+ZOBRIST_SEED = 0x5eed0b0a
+
+# Tables are saved to a cache file the first time they are needed, so later
+# processes can memory-map them instead of generating them again (which gets
+# slow for deeper boards). A cache file is:
+#
+#   header: TABLES_MAGIC, TABLES_VERSION and the depth (uint32 each), then the
+#           side key (uint64)
+#   then each of Tables.ARRAYS in order, in native byte order
+#
+# TABLES_VERSION must be increased whenever what the tables contain changes,
+# so that old cache files are ignored.
+
+TABLES_MAGIC = b"UXOTABL1"
+TABLES_VERSION = 1
+TABLES_HEADER = struct.Struct("=8sIIQ")
+
+# INVERSE_SYMMETRIES[k] is the symmetry which undoes symmetry k (see
+# Tables.transform())
+INVERSE_SYMMETRIES = (0, 3, 2, 1, 4, 5, 6, 7)
+
+
+def cache_directory():
+    """Returns the directory for cache files: $ULTIMATEXO_CACHE if it is
+    set, or ultimatexo in the user's cache directory"""
+    directory = os.environ.get("ULTIMATEXO_CACHE")
+    if directory:
+        return directory
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ultimatexo")
+
+
+class Tables(object):
+    """Lookup tables for positions of one depth. Zobrist keys are generated
+    from a fixed seed so that a position has the same hash in every process
+    and every run.
+
+    square_keys has the keys for X then O on each square in turn, so the key
+    for player on square i is square_keys[i * 2 + player - 1]. symmetries
+    holds the eight symmetries of the full grid (the rotations, then the
+    reflections of each), as where each square goes: square i moves to
+    symmetries[k * squares + i] under symmetry k. As the grid is the same at
+    every level, this also moves boards to boards."""
+
+    # The arrays saved in a cache file, in order, with their array typecodes
+    ARRAYS = (("square_keys", "Q"), ("forced_keys", "Q"), ("grid_to_index", "I"), ("symmetries", "I"))
+
+    def __init__(self, depth, data=None):
+        """data, if given, is the contents of a cache file written by save()
+        (usually memory-mapped) to take the tables from instead of generating
+        them. Raises ValueError if it isn't one for depth."""
+        if depth < 2:
+            raise ValueError("Positions must be at least 2 levels deep")
+        self.depth = depth
+        self.size = 3 ** depth  # Rows and columns on the full grid
+        self.squares = 9 ** depth
+        self.powers = tuple(9 ** l for l in range(depth + 1))
+
+        # Forced board keys are numbered with 0 for ANY, then the boards of
+        # each level in turn from the leaf boards up
+        self.forced_offsets = [None, 1]
+        for level in range(1, depth - 1):
+            self.forced_offsets.append(self.forced_offsets[-1] + 9 ** (depth - level))
+
+        if data is None:
+            self._generate()
+        else:
+            self._load(data)
+
+    def _lengths(self):
+        return {
+            "square_keys": 2 * self.squares,
+            "forced_keys": 1 + sum(9 ** (self.depth - l) for l in range(1, self.depth)),
+            "grid_to_index": self.squares,
+            "symmetries": 8 * self.squares,
+        }
+
+    def _generate(self):
+        depth = self.depth
+        size = self.size
+        lengths = self._lengths()
+        rng = random.Random(ZOBRIST_SEED + depth - 2)
+        self.square_keys = tuple(rng.getrandbits(64) for i in range(lengths["square_keys"]))
+        self.forced_keys = tuple(rng.getrandbits(64) for i in range(lengths["forced_keys"]))
+        self.side_key = rng.getrandbits(64)  # XORed in when O is to play
+
+        # Maps (row, col) on the full grid to a square index
+        grid_to_index = array("I")
+        for r in range(size):
+            for c in range(size):
+                i = 0
+                for level in reversed(range(depth)):
+                    shift = 3 ** level
+                    i = i * 9 + ((r // shift) % 3) * 3 + (c // shift) % 3
+                grid_to_index.append(i)
+        self.grid_to_index = grid_to_index
+
+        n = size - 1
+        symmetries = array("I", bytes(4 * lengths["symmetries"]))
+        for r in range(size):
+            for c in range(size):
+                i = grid_to_index[r * size + c]
+                images = ((r, c), (c, n - r), (n - r, n - c), (n - c, r),
+                          (r, n - c), (c, r), (n - r, c), (n - c, n - r))
+                for (k, (r2, c2)) in enumerate(images):
+                    symmetries[k * self.squares + i] = grid_to_index[r2 * size + c2]
+        self.symmetries = symmetries
+
+    def _load(self, data):
+        lengths = self._lengths()
+        expected = TABLES_HEADER.size + sum(
+            lengths[name] * array(typecode).itemsize for (name, typecode) in Tables.ARRAYS)
+        if len(data) != expected:
+            raise ValueError("Tables cache file is the wrong size")
+        (magic, version, depth, self.side_key) = TABLES_HEADER.unpack_from(data, 0)
+        if magic != TABLES_MAGIC or version != TABLES_VERSION or depth != self.depth:
+            raise ValueError("Not a tables cache file for depth {}".format(self.depth))
+        view = memoryview(data)
+        offset = TABLES_HEADER.size
+        for (name, typecode) in Tables.ARRAYS:
+            end = offset + lengths[name] * array(typecode).itemsize
+            setattr(self, name, view[offset:end].cast(typecode))
+            offset = end
+        # Keys are read on every move, and a tuple of ints is several times
+        # quicker to index than a memoryview of 64 bit values
+        self.square_keys = tuple(self.square_keys)
+        self.forced_keys = tuple(self.forced_keys)
+
+    def save(self, path):
+        """Writes the tables to the cache file at path. The file is written
+        under another name and then renamed, so a process reading it never
+        sees half of it."""
+        import tempfile  # Only needed the first time the tables are made
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        (fd, temporary) = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(TABLES_HEADER.pack(TABLES_MAGIC, TABLES_VERSION, self.depth, self.side_key))
+                for (name, typecode) in Tables.ARRAYS:
+                    f.write(array(typecode, getattr(self, name)).tobytes())
+            # mkstemp makes the file readable only by its owner, and the
+            # cache directory may be shared by other users
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def transform(self, i, k):
+        """Returns where square i goes under symmetry k"""
+        return self.symmetries[k * self.squares + i]
+
+    def forced_key(self, forced, level):
+        if forced == ANY:
+            return self.forced_keys[0]
+        return self.forced_keys[self.forced_offsets[level] + forced]
+
+
+_tables = {}
+
+
+def tables(depth):
+    """Returns the (shared) Tables for positions of depth, from the cache
+    file if there is one"""
+    t = _tables.get(depth)
+    if t is None:
+        t = _tables[depth] = _cached_tables(depth)
+    return t
+
+
+def _cached_tables(depth):
+    path = os.path.join(
+        cache_directory(), "tables-{}-{}-{}.bin".format(TABLES_VERSION, depth, sys.byteorder))
+    try:
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return Tables(depth, data)
+    except (OSError, ValueError):
+        pass
+    t = Tables(depth)
+    try:
+        t.save(path)
+    except OSError:
+        pass  # The cache is only there to save time
+    return t
+
+
+# The depth 2 tables, which GameState uses as well as Position
+SQUARE_KEYS = tables(2).square_keys
+FORCED_KEYS = tables(2).forced_keys
+SIDE_KEY = tables(2).side_key
+GRID_TO_INDEX = tables(2).grid_to_index
+
+TOKENS = {EMPTY: ".", X: "x", O: "o"}
+PLAYERS = {"x": X, "o": O}
+STARTPOS = "9/9/9/9/9/9/9/9/9 x -"
+
+
+def startpos(depth=2):
+    """Returns the notation for the empty grid of depth with X to play"""
+    size = 3 ** depth
+    return "{} x -".format("/".join([str(size)] * size))
+
+
+def has_line(states, base, s, player):
+    """Returns True if player holds a line through s in the board whose nine
+    states start at states[base]"""
+    for (a, b, c) in LINES_THROUGH[s]:
+        if states[base + a] == states[base + b] == states[base + c] == player:
+            return True
+    return False
+
+
+def winning_line(states, base):
+    """Returns the first and last squares (0-8) of a line held by X or O in
+    the board whose nine states start at states[base], or None"""
+    for (a, b, c) in LINES:
+        if states[base + a] == states[base + b] == states[base + c] in (X, O):
+            return (a, c)
+    return None
+
+
+def board_result(states, base):
+    """Returns the result of the board whose nine states start at
+    states[base]: X or O if they hold a line, DRAWN if it is full, or EMPTY
+    if it is still open"""
+    for player in (X, O):
+        if any(has_line(states, base, s, player) for s in (0, 4, 8)):
+            return player
+    if EMPTY in states[base:base + 9]:
+        return EMPTY
+    return DRAWN
+
+
+class Position(object):
+    __slots__ = ("levels", "cells", "boards", "tables", "depth", "player",
+                 "forced", "forced_level", "winner", "hash", "ply")
+
+    def __init__(self, player=X, depth=2):
+        self.tables = tables(depth)
+        self.depth = depth
+        # Boards are EMPTY while open, then X, O or DRAWN
+        self.levels = [[EMPTY] * 9 ** (depth - l) for l in range(depth)]
+        self.cells = self.levels[0]
+        self.boards = self.levels[1]  # The leaf boards
+        self.player = player
+        # The board which must be played in, an index into levels[forced_level]
+        self.forced = ANY
+        self.forced_level = 1
+        self.winner = None  # None while in play, EMPTY for a draw, or X or O
+        self.ply = 0
+        self.hash = self.tables.forced_keys[0] ^ (self.tables.side_key if player == O else 0)
+
+    def copy(self):
+        other = Position.__new__(Position)
+        other.levels = [states[:] for states in self.levels]
+        other.cells = other.levels[0]
+        other.boards = other.levels[1]
+        other.tables = self.tables
+        other.depth = self.depth
+        other.player = self.player
+        other.forced = self.forced
+        other.forced_level = self.forced_level
+        other.winner = self.winner
+        other.ply = self.ply
+        other.hash = self.hash
+        return other
+
+    def canonical(self):
+        """Returns (hash, k), where hash is the lowest of the hashes of the
+        eight rotations and reflections of this position, and k is the
+        symmetry which gives it. Positions which are rotations or reflections
+        of each other have the same canonical hash, and a move m in this
+        position is tables.transform(m, k) in the canonical one."""
+        t = self.tables
+        keys = t.square_keys
+        symmetries = t.symmetries
+        occupied = [(i, state - 1) for (i, state) in enumerate(self.cells) if state != EMPTY]
+        side = t.side_key if self.player == O else 0
+        power = t.powers[self.forced_level]
+        best = None
+        for k in range(8):
+            offset = k * t.squares
+            h = side
+            for (i, p) in occupied:
+                h ^= keys[symmetries[offset + i] * 2 + p]
+            if self.forced == ANY:
+                h ^= t.forced_keys[0]
+            else:
+                h ^= t.forced_key(symmetries[offset + self.forced * power] // power, self.forced_level)
+            if best is None or h < best[0]:
+                best = (h, k)
+        return best
+
+    def region(self):
+        """Returns (level, index) of the board which must be played in next;
+        (depth, 0) means any open board"""
+        if self.forced == ANY:
+            return (self.depth, 0)
+        return (self.forced_level, self.forced)
+
+    def legal_moves(self):
+        """Returns a list of the square indices which may be played"""
+        if self.winner is not None:
+            return []
+        (level, board) = self.region()
+        boards = [board]
+        while level > 1:
+            states = self.levels[level - 1]
+            boards = [b for n in boards for b in range(n * 9, n * 9 + 9) if states[b] == EMPTY]
+            level -= 1
+        cells = self.cells
+        return [i for b in boards for i in range(b * 9, b * 9 + 9) if cells[i] == EMPTY]
+
+    def random_move(self, rng):
+        """Returns a legal move chosen with rng (a random.Random). Rather than
+        listing every legal move, this picks an open board at random at each
+        level on the way down, so it takes time proportional to depth however
+        large the grid is. Moves are therefore not all equally likely when
+        more than one board is open."""
+        (level, board) = self.region()
+        levels = self.levels
+        while level > 0:
+            states = levels[level - 1]
+            base = board * 9
+            board = rng.choice([i for i in range(base, base + 9) if states[i] == EMPTY])
+            level -= 1
+        return board
+
+    def is_legal(self, move):
+        if self.winner is not None or not 0 <= move < len(self.cells) or self.cells[move] != EMPTY:
+            return False
+        board = move
+        for level in range(1, self.depth):
+            board //= 9
+            if self.levels[level][board] != EMPTY:
+                return False
+        return self.forced == ANY or move // self.tables.powers[self.forced_level] == self.forced
+
+    def play(self, move):
+        """Plays move (a square index) for the player to move. The move is
+        not checked; use is_legal() first if it came from outside. Only the
+        boards containing move are checked for a win or draw, so this takes
+        time proportional to depth."""
+        player = self.player
+        levels = self.levels
+        depth = self.depth
+        t = self.tables
+
+        # Record the move, then work up the levels for as long as each board
+        # is closed (won or drawn) by the change to the one below it
+        states = levels[0]
+        states[move] = player
+        i = move
+        level = 1
+        while True:
+            (board, s) = divmod(i, 9)
+            base = board * 9
+            if has_line(states, base, s, player):
+                result = player
+            elif EMPTY not in states[base:base + 9]:
+                result = DRAWN
+            else:
+                break
+            if level == depth:
+                self.winner = EMPTY if result == DRAWN else result
+                break
+            states = levels[level]
+            states[board] = result
+            i = board
+            level += 1
+
+        (forced, forced_level) = self._forced_after(move % t.powers[depth - 1])
+        self.hash ^= (t.square_keys[move * 2 + player - 1]
+                      ^ t.forced_key(self.forced, self.forced_level)
+                      ^ t.forced_key(forced, forced_level)
+                      ^ t.side_key)
+        self.forced = forced
+        self.forced_level = forced_level
+        self.player = 3 - player
+        self.ply += 1
+
+    def _forced_after(self, board, level=1):
+        """Returns (forced, forced_level) when play is sent to board at level.
+        If that board or any board containing it is closed, play may be
+        anywhere in the board containing the highest closed one."""
+        forced = board
+        forced_level = level
+        while level < self.depth:
+            if self.levels[level][board] != EMPTY:
+                forced = board // 9
+                forced_level = level + 1
+            board //= 9
+            level += 1
+        if forced_level == self.depth:
+            return (ANY, 1)
+        return (forced, forced_level)
+
+    def result(self, player):
+        """Returns 1 if player has won, -1 if they have lost, 0 for a draw
+        and None if the game is still in play"""
+        if self.winner is None:
+            return None
+        if self.winner == EMPTY:
+            return 0
+        return 1 if self.winner == player else -1
+
+    @staticmethod
+    def from_cells(cells, player, forced=ANY, forced_level=1):
+        """Returns a Position with the given square states (a sequence of
+        9 ** depth values in square index order), player to move and forced
+        board (an index at forced_level). Board and game winners are derived
+        from the squares."""
+        depth = 2
+        while 9 ** depth < len(cells):
+            depth += 1
+        if 9 ** depth != len(cells):
+            raise ValueError("A position needs 81, 729, 6561... squares, not {}".format(len(cells)))
+
+        p = Position(player, depth)
+        p.cells[:] = cells
+        for i in range(len(cells)):
+            if cells[i] != EMPTY:
+                p.hash ^= p.tables.square_keys[i * 2 + cells[i] - 1]
+                p.ply += 1
+        for level in range(1, depth):
+            below = p.levels[level - 1]
+            states = p.levels[level]
+            for b in range(len(states)):
+                states[b] = board_result(below, b * 9)
+        result = board_result(p.levels[depth - 1], 0)
+        if result != EMPTY:
+            p.winner = EMPTY if result == DRAWN else result
+        if forced != ANY:
+            (p.forced, p.forced_level) = p._forced_after(forced, forced_level)
+            p.hash ^= p.tables.forced_keys[0] ^ p.tables.forced_key(p.forced, p.forced_level)
+        return p
+
+    @staticmethod
+    def from_game(game):
+        """Returns a Position equivalent to the state of game.Game"""
+        cells = [EMPTY] * 81
+        for b in range(9):
+            child = game.main_board.square(b // 3, b % 3).child
+            for s in range(9):
+                cells[b * 9 + s] = child.square(s // 3, s % 3).state.value
+        forced = ANY
+        if game.last_move is not None:
+            forced = game.last_move[0] * 3 + game.last_move[1]
+        return Position.from_cells(cells, game.active_player.value, forced)
+
+    def __eq__(self, other):
+        return (isinstance(other, Position)
+                and self.cells == other.cells
+                and self.player == other.player
+                and self.forced == other.forced
+                and self.forced_level == other.forced_level)
+
+    def __hash__(self):
+        return self.hash
+
+    def __str__(self):
+        return to_notation(self)
+
+
+# Position notation is a single line with three fields separated by spaces,
+# similar to FEN in chess:
+#
+#   1. The grid, one row at a time from the top, separated by "/". Each row
+#      lists its squares from left to right as "x", "o", or a number giving
+#      a run of that many empty squares. There are 9 rows at depth 2, 27 at
+#      depth 3 and so on.
+#   2. The player to move, "x" or "o".
+#   3. The board which must be played in, as row and col digits for each
+#      level from the top (e.g. "02" for the top right board at depth 2), or
+#      "-" if any open board may be played.
+#
+# The starting position with X to play is "9/9/9/9/9/9/9/9/9 x -".
+#
+# Moves are written as row and col digits for each level from the top, so
+# at depth 2 "1102" is the top right square of the centre board.
+
+def from_notation(text):
+    """Returns the Position described by text. Raises ValueError if text is
+    not valid position notation."""
+    fields = text.split()
+    if len(fields) != 3:
+        raise ValueError("Position notation has three fields: {!r}".format(text))
+    (grid, side, forced) = fields
+
+    rows = grid.split("/")
+    depth = 2
+    while 3 ** depth < len(rows):
+        depth += 1
+    size = 3 ** depth
+    if size != len(rows):
+        raise ValueError("Position notation needs 9, 27, 81... rows: {!r}".format(grid))
+    grid_to_index = tables(depth).grid_to_index
+
+    cells = [EMPTY] * (size * size)
+    for (r, row) in enumerate(rows):
+        c = 0
+        run = 0
+        for token in row:
+            if token in "0123456789":
+                run = run * 10 + int(token)
+                continue
+            if token not in PLAYERS:
+                raise ValueError("Unexpected {!r} in row {}".format(token, r))
+            c += run
+            run = 0
+            if c < size:
+                cells[grid_to_index[r * size + c]] = PLAYERS[token]
+            c += 1
+        c += run
+        if c != size:
+            raise ValueError("Row {} does not have {} squares: {!r}".format(r, size, row))
+
+    if side not in PLAYERS:
+        raise ValueError("Player to move must be x or o: {!r}".format(side))
+
+    if forced == "-":
+        return Position.from_cells(cells, PLAYERS[side])
+    board = _from_path(forced)
+    if board is None or not 2 <= len(forced) <= 2 * (depth - 1):
+        raise ValueError("Forced board must be - or row col pairs: {!r}".format(forced))
+    return Position.from_cells(cells, PLAYERS[side], board, depth - len(forced) // 2)
+
+
+def to_notation(position):
+    """Returns the position notation for position"""
+    size = position.tables.size
+    grid_to_index = position.tables.grid_to_index
+    rows = []
+    for r in range(size):
+        row = ""
+        run = 0
+        for c in range(size):
+            state = position.cells[grid_to_index[r * size + c]]
+            if state == EMPTY:
+                run += 1
+            else:
+                if run:
+                    row += str(run)
+                    run = 0
+                row += TOKENS[state]
+        if run:
+            row += str(run)
+        rows.append(row)
+    if position.forced == ANY:
+        forced = "-"
+    else:
+        forced = _to_path(position.forced, position.depth - position.forced_level)
+    return "{} {} {}".format("/".join(rows), TOKENS[position.player], forced)
+
+
+def _from_path(text):
+    """Returns the index written as text, a row and col digit for each
+    level, or None if text is not valid"""
+    if len(text) % 2 != 0 or any(d not in "012" for d in text):
+        return None
+    i = 0
+    for k in range(0, len(text), 2):
+        i = i * 9 + int(text[k]) * 3 + int(text[k + 1])
+    return i
+
+
+def _to_path(i, levels):
+    digits = []
+    for level in range(levels):
+        (i, s) = divmod(i, 9)
+        digits.append("{}{}".format(s // 3, s % 3))
+    return "".join(reversed(digits))
+
+
+def from_move_notation(text, depth=2):
+    """Returns the square index for a move written as row and col digits for
+    each of depth levels. Raises ValueError if text is not valid move
+    notation."""
+    move = _from_path(text)
+    if move is None or len(text) != 2 * depth:
+        raise ValueError("Moves are {} digits from 0-2: {!r}".format(2 * depth, text))
+    return move
+
+
+def to_move_notation(move, depth=2):
+    """Returns the notation for the move at square index move"""
+    return _to_path(move, depth)
+
+
+def grid_coordinates(i, levels):
+    """Returns the (row, col) on a grid of 3 ** levels rows and columns of the
+    square or board with index i, which has a digit for each of levels"""
+    row = 0
+    col = 0
+    shift = 1
+    for level in range(levels):
+        (i, s) = divmod(i, 9)
+        row += (s // 3) * shift
+        col += (s % 3) * shift
+        shift *= 3
+    return (row, col)
+
+
+def from_move_coordinates(child_board, square):
+    """Returns the square index for (row, col) tuples child_board and square,
+    as passed to Game.play()"""
+    return (child_board[0] * 3 + child_board[1]) * 9 + square[0] * 3 + square[1]
+
+
+def to_move_coordinates(move):
+    """Returns (child_board, square) as (row, col) tuples for the move at
+    square index move, suitable for passing to Game.play()"""
+    (b, s) = divmod(move, 9)
+    return ((b // 3, b % 3), (s // 3, s % 3))
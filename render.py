@@ -0,0 +1,297 @@
+#!/usr/bin/python
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import position
+from gameboard import CanvasHelper
+from position import Position
+
+# Draws positions to SVG or PostScript files without a display. CanvasHelper
+# only needs a handful of canvas methods, so VectorCanvas provides those and
+# records what is drawn instead of showing it; the pictures are exactly the
+# ones the GUI draws.
+#
+# Each image is named after the hash of its position and its size, so a
+# position is only ever drawn once at each size however many times it turns
+# up, and a run over files that have mostly been rendered before only draws
+# what is new.
+
+FORMATS = ("svg", "ps")
+
+# RGB for the colours CanvasHelper uses, for PostScript
+COLOURS = {
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "red": (255, 0, 0),
+    "blue": (0, 0, 255),
+    "yellow": (255, 255, 0),
+}
+
+# Fraction of pixels drawn by each Tk stipple pattern
+STIPPLES = {
+    "gray12": 0.125,
+    "gray25": 0.25,
+    "gray50": 0.5,
+    "gray75": 0.75,
+}
+
+SVG_CAPS = {"butt": "butt", "round": "round", "projecting": "square"}
+PS_CAPS = {"butt": 0, "round": 1, "projecting": 2}
+
+
+def rgb(colour):
+    """Returns colour, a Tk colour name or #rgb or #rrggbb, as (r, g, b)"""
+    if colour.startswith("#"):
+        digits = colour[1:]
+        if 3 == len(digits):
+            digits = "".join(d * 2 for d in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    return COLOURS[colour]
+
+
+class VectorCanvas(object):
+    """Enough of a tkinter Canvas for CanvasHelper to draw on, which keeps a
+    list of the items drawn so they can be written out as SVG or PostScript.
+    Each item is (kind, coords, options, tags), in drawing order."""
+
+    def __init__(self, width, height, background="white"):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.items = []
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def _create(self, kind, coords, options):
+        tags = options.pop("tags", None) or options.pop("tag", ())
+        if isinstance(tags, str):
+            tags = (tags,)
+        self.items.append((kind, coords, options, tuple(tags)))
+
+    def create_line(self, *coords, **options):
+        self._create("line", coords, options)
+
+    def create_oval(self, *coords, **options):
+        self._create("oval", coords, options)
+
+    def create_rectangle(self, *coords, **options):
+        self._create("rectangle", coords, options)
+
+    def delete(self, tag):
+        if "all" == tag:
+            self.items = []
+        else:
+            self.items = [item for item in self.items if tag not in item[3]]
+
+    def tag_lower(self, tag, below=None):
+        """Moves the items tagged tag to just below the first item tagged
+        below, or to the bottom"""
+        lowered = [item for item in self.items if tag in item[3]]
+        rest = [item for item in self.items if tag not in item[3]]
+        at = 0
+        if below is not None:
+            for (i, item) in enumerate(rest):
+                if below in item[3]:
+                    at = i
+                    break
+            else:
+                at = len(rest)
+        self.items = rest[:at] + lowered + rest[at:]
+
+    def to_svg(self):
+        """Returns the drawing as an SVG document"""
+        out = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" '
+               'viewBox="0 0 {0} {1}">'.format(self.width, self.height)]
+        if self.background is not None:
+            out.append('<rect width="100%" height="100%" fill="{}"/>'.format(self.background))
+        for (kind, c, options, tags) in self.items:
+            width = options.get("width", 1)
+            if "line" == kind:
+                out.append(
+                    '<line x1="{:.2f}" y1="{:.2f}" x2="{:.2f}" y2="{:.2f}" stroke="{}" '
+                    'stroke-width="{:.2f}" stroke-linecap="{}"/>'.format(
+                        c[0], c[1], c[2], c[3], options.get("fill", "black"), width,
+                        SVG_CAPS[options.get("capstyle", "butt")]))
+            elif "oval" == kind:
+                out.append(
+                    '<ellipse cx="{:.2f}" cy="{:.2f}" rx="{:.2f}" ry="{:.2f}" fill="none" '
+                    'stroke="{}" stroke-width="{:.2f}"/>'.format(
+                        (c[0] + c[2]) / 2, (c[1] + c[3]) / 2, (c[2] - c[0]) / 2, (c[3] - c[1]) / 2,
+                        options.get("outline", "black"), width))
+            else:
+                opacity = STIPPLES.get(options.get("stipple"), 1)
+                out.append(
+                    '<rect x="{:.2f}" y="{:.2f}" width="{:.2f}" height="{:.2f}" fill="{}" '
+                    'fill-opacity="{}"/>'.format(
+                        c[0], c[1], c[2] - c[0], c[3] - c[1], options.get("fill", "none"), opacity))
+        out.append("</svg>")
+        return "\n".join(out) + "\n"
+
+    def to_postscript(self):
+        """Returns the drawing as an Encapsulated PostScript document.
+        PostScript has no transparency, so stippled fills are drawn as the
+        colour they would average out to on the background."""
+        out = ["%!PS-Adobe-3.0 EPSF-3.0",
+               "%%BoundingBox: 0 0 {} {}".format(self.width, self.height),
+               # Tk's y axis points down
+               "0 {} translate 1 -1 scale".format(self.height)]
+
+        def colour(name, alpha=1):
+            (r, g, b) = rgb(name)
+            if alpha < 1:
+                (r0, g0, b0) = rgb(self.background or "white")
+                (r, g, b) = (r0 + (r - r0) * alpha, g0 + (g - g0) * alpha, b0 + (b - b0) * alpha)
+            return "{:.3f} {:.3f} {:.3f} setrgbcolor".format(r / 255, g / 255, b / 255)
+
+        if self.background is not None:
+            out.append("{} 0 0 {} {} rectfill".format(
+                colour(self.background), self.width, self.height))
+        for (kind, c, options, tags) in self.items:
+            width = options.get("width", 1)
+            if "line" == kind:
+                out.append("{} {:.2f} setlinewidth {} setlinecap newpath "
+                           "{:.2f} {:.2f} moveto {:.2f} {:.2f} lineto stroke".format(
+                               colour(options.get("fill", "black")), width,
+                               PS_CAPS[options.get("capstyle", "butt")], c[0], c[1], c[2], c[3]))
+            elif "oval" == kind:
+                # Only the matrix is saved and restored around the arc, as
+                # grestore would throw the path away too, and it is stroked
+                # with the unscaled line width
+                out.append("{} {:.2f} setlinewidth newpath matrix currentmatrix {:.2f} {:.2f} translate "
+                           "{:.2f} {:.2f} scale 0 0 1 0 360 arc setmatrix stroke".format(
+                               colour(options.get("outline", "black")), width,
+                               (c[0] + c[2]) / 2, (c[1] + c[3]) / 2,
+                               (c[2] - c[0]) / 2, (c[3] - c[1]) / 2))
+            elif options.get("fill"):
+                out.append("{} {:.2f} {:.2f} {:.2f} {:.2f} rectfill".format(
+                    colour(options["fill"], STIPPLES.get(options.get("stipple"), 1)),
+                    c[0], c[1], c[2] - c[0], c[3] - c[1]))
+        out.append("showpage")
+        out.append("%%EOF")
+        return "\n".join(out) + "\n"
+
+
+def render(pos, size=270, format="svg"):
+    """Returns pos drawn as an SVG or PostScript document, size units
+    square"""
+    canvas = VectorCanvas(size, size)
+    CanvasHelper.draw_position(canvas, pos)
+    if "svg" == format:
+        return canvas.to_svg()
+    return canvas.to_postscript()
+
+
+def filename(pos, size=270, format="svg"):
+    """Returns the name of the image file for pos drawn size units square"""
+    return "{:016x}-{}.{}".format(pos.hash, size, format)
+
+
+def _render_file(args):
+    (notation, path, size, format) = args
+    with open(path + ".tmp", "w") as f:
+        f.write(render(position.from_notation(notation), size, format))
+    os.replace(path + ".tmp", path)
+
+
+def game_positions(line):
+    """Returns every position in the game record line (in the JSON format
+    described in the README), from the start to the last move. Raises
+    ValueError if the record can't be read."""
+    try:
+        moves = json.loads(line)["moves"]
+        if not moves:
+            return []
+        pos = Position(position.PLAYERS[moves[0]["player"].lower()])
+        positions = [pos.copy()]
+        for m in moves:
+            move = position.from_move_coordinates(m["board"], m["square"])
+            if not pos.is_legal(move):
+                raise ValueError("Illegal move {}".format(m))
+            pos.play(move)
+            positions.append(pos.copy())
+    except (KeyError, TypeError, IndexError, AttributeError) as e:
+        raise ValueError("Bad game record: {}".format(e))
+    return positions
+
+
+def run(groups, directory, size=270, format="svg", jobs=None, window=4096, chunksize=64, progress=None):
+    """Renders every position in groups, an iterable of lists of positions,
+    into directory, skipping those which already have an image there (and
+    drawing repeats within each window of groups only once). Yields the list
+    of file names for each group, in order. At most window groups are held
+    in memory at once."""
+    os.makedirs(directory, exist_ok=True)
+    positions_seen = 0
+    drawn = 0
+    with multiprocessing.Pool(jobs) as pool:
+        groups = iter(groups)
+        while True:
+            batch = list(itertools.islice(groups, window))
+            if not batch:
+                break
+            names = []
+            tasks = []
+            seen = set()
+            for positions in batch:
+                names.append([filename(pos, size, format) for pos in positions])
+                positions_seen += len(positions)
+                for (pos, name) in zip(positions, names[-1]):
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                    path = os.path.join(directory, name)
+                    if not os.path.exists(path):
+                        tasks.append((position.to_notation(pos), path, size, format))
+            for result in pool.imap_unordered(_render_file, tasks, chunksize):
+                pass
+            drawn += len(tasks)
+            if progress is not None:
+                progress(positions_seen, drawn)
+            yield from names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Draw positions as SVG or PostScript files named after their hash and size, "
+                    "and print the file names for each input line.")
+    parser.add_argument("infile", help="positions, one per line, as for the engine's position command")
+    parser.add_argument("-o", "--output", required=True, help="directory for the images")
+    parser.add_argument("--games", action="store_true",
+                        help="infile has a JSON game record on each line; draw every position of each game")
+    parser.add_argument("--format", choices=FORMATS, default="svg")
+    parser.add_argument("--size", type=int, default=270, help="width and height of each image")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    def groups(f):
+        for line in f:
+            line = line.rstrip("\n")
+            try:
+                if args.games:
+                    yield game_positions(line)
+                else:
+                    from engine import EngineProtocol
+                    yield [EngineProtocol.parse_position(line.split())]
+            except ValueError as e:
+                print("skipping {}: {}".format(line, e), file=sys.stderr)
+                yield []
+
+    def progress(positions, drawn):
+        print("{} positions, {} drawn".format(positions, drawn), file=sys.stderr)
+
+    with open(args.infile) as f:
+        for names in run(groups(f), args.output, args.size, args.format, args.jobs, progress=progress):
+            print(" ".join(names))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import batch
+import position
+from cache import AnalysisCache
+from engine import Engine
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def analyse(self, lines, analysis_cache=None, jobs=1):
+        """Runs batch.run over lines and returns the output lines"""
+        infile = os.path.join(self.directory, "in.txt")
+        outfile = os.path.join(self.directory, "out.txt")
+        with open(infile, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        if os.path.exists(outfile):
+            os.unlink(outfile)
+        batch.run(infile, outfile, playouts=200, jobs=jobs, analysis_cache=analysis_cache, seed=1)
+        with open(outfile) as f:
+            return [line.rstrip("\n").split("\t") for line in f]
+
+    def test_repeats_are_searched_once(self):
+        analysis_cache = AnalysisCache(os.path.join(self.directory, "cache.sqlite"), Engine().version())
+        try:
+            # 2222 is 0000 rotated by a half turn
+            out = self.analyse(["startpos", "startpos moves 0000", "startpos",
+                                "startpos moves 2222"], analysis_cache)
+            analysis_cache.flush()
+            (rows,) = analysis_cache.connection.execute("SELECT COUNT(*) FROM analysis").fetchone()
+        finally:
+            analysis_cache.close()
+        self.assertEqual(2, rows)
+        self.assertEqual(out[0][1:], out[2][1:])
+        rotated = "".join(str(2 - int(d)) for d in out[1][1])
+        self.assertEqual([rotated] + out[1][2:], out[3][1:])
+
+    def test_bad_lines(self):
+        out = self.analyse(["startpos", "bad line", "startpos"])
+        self.assertEqual("error", out[1][1])
+        self.assertEqual(out[0][1:], out[2][1:])
+
+    def test_same_results_with_more_workers(self):
+        lines = []
+        for opening in ("1111", "0000 0011", "2121 1012"):
+            moves = []
+            lines.append("startpos")
+            for move in opening.split():
+                moves.append(move)
+                lines.append("startpos moves " + " ".join(moves))
+        self.assertEqual(self.analyse(lines), self.analyse(lines, jobs=3))
+        # startpos was searched for the first game, so the second game's
+        # first move starts a run, and gets the same result as on its own
+        self.assertEqual(self.analyse(lines)[3], self.analyse([lines[3]])[0])
+
+    def test_follows(self):
+        first = position.from_notation(position.STARTPOS)
+        second = first.copy()
+        second.play(position.from_move_notation("1111"))
+        third = second.copy()
+        third.play(position.from_move_notation("1100"))
+        self.assertTrue(batch.follows(second, first))
+        self.assertTrue(batch.follows(third, second))
+        self.assertFalse(batch.follows(third, first))
+        self.assertFalse(batch.follows(first, second))
+        self.assertFalse(batch.follows(first, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import position
+from cache import AnalysisCache
+from engine import SearchResult
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = AnalysisCache(os.path.join(self.directory, "cache.sqlite"), "test")
+
+    def tearDown(self):
+        self.cache.connection.close()
+        shutil.rmtree(self.directory)
+
+    def test_recent_hits_are_recorded(self):
+        pos = position.from_notation(position.STARTPOS)
+        self.cache.put(pos, "playouts 1", SearchResult(bestmove=40, score=0.5, pv=[40]))
+        self.cache.flush()
+        self.cache.connection.execute("UPDATE analysis SET used = 0")
+        # Served from memory, without reading the database
+        self.assertIsNotNone(self.cache.get(pos, "playouts 1"))
+        self.cache.flush()
+        (used,) = self.cache.connection.execute("SELECT used FROM analysis").fetchone()
+        self.assertGreater(used, 0)
+
+    def test_symmetric_positions_share_an_analysis(self):
+        for (depth, moves) in ((2, ["0001", "0112", "1201"]), (3, ["000102", "010200"])):
+            tables = position.tables(depth)
+            start = position.Position(position.X, depth)
+            played = [position.from_move_notation(m, depth) for m in moves]
+            pos = start.copy()
+            for m in played:
+                pos.play(m)
+            legal = pos.legal_moves()
+            result = SearchResult(bestmove=legal[0], score=0.25, nodes=10, playouts=10,
+                                  pv=[legal[0], legal[1]])
+            budget = "playouts {}".format(depth)
+            self.cache.put(pos, budget, result)
+            for k in range(8):
+                # The same game, rotated or reflected by symmetry k
+                other = start.copy()
+                for m in played:
+                    other.play(tables.transform(m, k))
+                found = self.cache.get(other, budget)
+                self.assertEqual(tables.transform(result.bestmove, k), found.bestmove)
+                self.assertEqual([tables.transform(m, k) for m in result.pv], found.pv)
+                self.assertTrue(other.is_legal(found.bestmove))
+                self.assertEqual(0.25, found.score)
+            # And the same again from the database rather than memory
+            self.cache.flush()
+            reopened = AnalysisCache(os.path.join(self.directory, "cache.sqlite"), "test")
+            other = start.copy()
+            for m in played:
+                other.play(tables.transform(m, 1))
+            self.assertEqual(tables.transform(result.bestmove, 1), reopened.get(other, budget).bestmove)
+            reopened.connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import book
+import position
+from engine import Engine, EngineProtocol
+from nodepool import NodePool, TranspositionTable
+
+
+def protocol(commands, engine=None):
+    """Runs commands through an EngineProtocol and returns its output lines"""
+    output = io.StringIO()
+    EngineProtocol(engine or Engine(seed=1), io.StringIO(commands), output).run()
+    return output.getvalue().splitlines()
+
+
+class EngineTest(unittest.TestCase):
+
+    def test_search_finds_a_legal_move(self):
+        pos = position.from_notation(position.STARTPOS)
+        result = Engine(seed=1).search(pos, playouts=200)
+        self.assertTrue(pos.is_legal(result.bestmove))
+        self.assertEqual(200, result.nodes)
+
+    def test_search_after_new_game(self):
+        engine = Engine(seed=1)
+        pos = position.from_notation(position.STARTPOS)
+        engine.search(pos, playouts=100)
+        engine.new_game()
+        result = engine.search(pos, playouts=100)
+        self.assertTrue(pos.is_legal(result.bestmove))
+
+    def test_newgame_command(self):
+        lines = protocol("position startpos\ngo playouts 200\nnewgame\n"
+                         "position startpos moves 1111\ngo playouts 200\nquit\n")
+        bestmoves = [line for line in lines if line.startswith("bestmove")]
+        self.assertEqual(2, len(bestmoves))
+
+    def test_transposition_table_outlives_the_tree(self):
+        engine = Engine(seed=1)
+        first = position.from_notation(position.STARTPOS)
+        first.play(position.from_move_notation("1111"))
+        second = position.from_notation(position.STARTPOS)
+        second.play(position.from_move_notation("0000"))
+        before = engine.search(first, playouts=2000)
+        engine.search(second, playouts=200)
+        # The tree for first was thrown away, but one iteration is enough to
+        # get back what was learned about its moves
+        after = engine.search(first, playouts=1)
+        self.assertEqual(before.bestmove, after.bestmove)
+        pool = engine.pool
+        self.assertGreater(pool.visits[pool.best_child(pool.root)], 100)
+
+    def test_table_counts_towards_max_nodes(self):
+        engine = Engine(max_nodes=20000, seed=1)
+        engine.search(position.from_notation(position.STARTPOS), playouts=3000)
+        table_bytes = len(engine.table) * TranspositionTable.SLOT_BYTES
+        self.assertLessEqual(engine.pool.capacity * NodePool.node_bytes() + table_bytes,
+                             20000 * NodePool.node_bytes())
+        self.assertLessEqual(engine.pool.size, engine.pool.capacity)
+
+    def test_max_memory(self):
+        engine = Engine(max_memory=1 << 20, seed=1)
+        for pos in (position.from_notation(position.STARTPOS), position.from_notation(position.startpos(3))):
+            engine.search(pos, playouts=10)
+            table_bytes = len(engine.table) * TranspositionTable.SLOT_BYTES
+            pool_bytes = engine.pool.capacity * NodePool.node_bytes(len(pos.cells))
+            self.assertLessEqual(pool_bytes + table_bytes, 1 << 20)
+            self.assertGreater(pool_bytes + table_bytes, (1 << 20) - NodePool.node_bytes(len(pos.cells)))
+
+    def test_version_depends_on_weights_and_book(self):
+        from evaluator import Evaluator
+        first = Evaluator()
+        second = Evaluator()
+        second.main[0] = 0.5
+        self.assertNotEqual(Engine(evaluator=first).version(), Engine(evaluator=second).version())
+        self.assertEqual(Engine(evaluator=first).version(), Engine(evaluator=Evaluator()).version())
+
+        directory = tempfile.mkdtemp()
+        try:
+            versions = []
+            for move in (40, 41):
+                path = os.path.join(directory, "{}.book".format(move))
+                with open(path, "wb") as f:
+                    f.write(book.HEADER.pack(book.MAGIC, 1))
+                    f.write(book.RECORD.pack(1, 10, 5, 0, move))
+                opening = book.Book(path)
+                versions.append(Engine(book=opening).version())
+                opening.close()
+            self.assertNotEqual(versions[0], versions[1])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_search_after_changing_depth(self):
+        engine = Engine(seed=1)
+        engine.search(position.from_notation(position.STARTPOS), playouts=50)
+        pos = position.from_notation(position.startpos(3))
+        result = engine.search(pos, playouts=50)
+        self.assertTrue(pos.is_legal(result.bestmove))
+
+
+if __name__ == "__main__":
+    unittest.main()
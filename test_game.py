@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+import copy
+import pickle
+import random
+import unittest
+
+import position
+from game import GameState, InvalidMoveException, SquareState
+
+
+class GameStateTest(unittest.TestCase):
+
+    def test_out_of_range_moves(self):
+        state = GameState.new()
+        for (child_board, square) in [((-1, 0), (0, 0)), ((0, 0), (0, -1)), ((3, 0), (0, 0)),
+                                      ((0, 0), (0, 3)), ((0, 0, 0), (0, 0)), ((0,), (0, 0)),
+                                      (None, (0, 0))]:
+            with self.assertRaises(InvalidMoveException):
+                state.play(child_board, square)
+
+    def test_matches_position(self):
+        rng = random.Random(1)
+        for game in range(20):
+            state = GameState.new(rng.choice("xo"))
+            while state.winner is None:
+                child_board = rng.choice(state.available_boards())
+                b = child_board[0] * 3 + child_board[1]
+                square = divmod(rng.choice([s for s in range(9) if state.boards[b][s] == position.EMPTY]), 3)
+                state = state.play(child_board, square)
+                pos = state.to_position()
+                self.assertEqual(hash(pos), hash(state))
+                self.assertEqual(state, GameState.from_position(pos))
+
+    def test_pickle_and_copy(self):
+        state = GameState.new().play((1, 1), (0, 2)).play((0, 2), (1, 1))
+        for other in (pickle.loads(pickle.dumps(state)), copy.deepcopy(state), copy.copy(state)):
+            self.assertEqual(state, other)
+            self.assertEqual(state.boards, other.boards)
+            self.assertEqual(state.forced, other.forced)
+            self.assertEqual(state.player, other.player)
+
+    def test_finished_game(self):
+        rng = random.Random(2)
+        for game in range(20):
+            state = GameState.new()
+            while state.winner is None:
+                self.assertEqual(sorted(state.available_boards()), sorted(state.to_game().available_boards()))
+                child_board = rng.choice(state.available_boards())
+                b = child_board[0] * 3 + child_board[1]
+                square = divmod(rng.choice([s for s in range(9) if state.boards[b][s] == position.EMPTY]), 3)
+                state = state.play(child_board, square)
+            game = state.to_game()
+            self.assertEqual(state.winner, game.overall_win)
+            self.assertEqual([], game.available_boards())
+            if state.winner != SquareState.empty:
+                self.assertEqual(state.winner, game.main_board.winner())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+import random
+import unittest
+
+from nodepool import NodePool, TranspositionTable
+
+
+def random_tree(pool, rng, expansions):
+    """Expands random leaves of pool and gives every node some visits"""
+    for i in range(expansions):
+        node = pool.root
+        while pool.child_count[node]:
+            node = rng.choice(pool.children(node))
+        if pool.free() < 9:
+            break
+        pool.expand(node, rng.sample(range(81), rng.randint(1, 9)))
+    for node in range(pool.size):
+        pool.visits[node] = rng.randint(0, 50)
+    pool.visits[pool.root] = 10000
+
+
+def tree(pool, node=None):
+    """Returns the tree below node as nested (move, visits, children) tuples,
+    which don't depend on where nodes are in the pool"""
+    if node is None:
+        node = pool.root
+    return (pool.move[node], pool.visits[node],
+            tuple(tree(pool, c) for c in pool.children(node)))
+
+
+class NodePoolTest(unittest.TestCase):
+
+    def check_invariants(self, pool):
+        self.assertEqual(-1, pool.parent[pool.root])
+        reachable = 1
+        stack = [pool.root]
+        while stack:
+            node = stack.pop()
+            for c in pool.children(node):
+                self.assertGreater(c, node)
+                self.assertLess(c, pool.size)
+                self.assertEqual(node, pool.parent[c])
+                reachable += 1
+                stack.append(c)
+        self.assertEqual(pool.size, reachable)
+
+    def test_compact_keeps_the_subtree(self):
+        rng = random.Random(1)
+        pool = NodePool(20000)
+        random_tree(pool, rng, 500)
+        child = pool.best_child(pool.root)
+        expected = tree(pool, child)
+        pool.advance(child)
+        self.assertEqual(0, pool.root)
+        self.assertEqual(expected, tree(pool))
+        self.check_invariants(pool)
+
+    def test_prune_frees_space(self):
+        rng = random.Random(2)
+        pool = NodePool(20000)
+        random_tree(pool, rng, 2000)
+        children = [pool.move[c] for c in pool.children(pool.root)]
+        target = pool.size // 4
+        pool.prune(target)
+        self.assertLessEqual(pool.size, target)
+        self.assertEqual(children, [pool.move[c] for c in pool.children(pool.root)])
+        self.check_invariants(pool)
+
+    def test_growing_pool(self):
+        grown = NodePool(20000, initial=16)
+        preallocated = NodePool(20000)
+        random_tree(grown, random.Random(3), 500)
+        random_tree(preallocated, random.Random(3), 500)
+        self.assertEqual(tree(preallocated), tree(grown))
+        self.assertLessEqual(grown.allocated, grown.capacity)
+        self.check_invariants(grown)
+
+    def test_full_pool(self):
+        for initial in (None, 4):
+            pool = NodePool(10, initial=initial)
+            pool.expand(pool.root, range(9))
+            with self.assertRaises(NodePool.PoolFull):
+                pool.expand(1, range(2))
+
+
+
+class TranspositionTableTest(unittest.TestCase):
+
+    def test_add_and_get(self):
+        table = TranspositionTable(100)
+        self.assertEqual(64, len(table))
+        self.assertIsNone(table.get(5))
+        table.add(5, 1.0)
+        table.add(5, -0.5)
+        self.assertEqual((2, 0.5), table.get(5))
+        table.clear()
+        self.assertIsNone(table.get(5))
+
+    def test_replace_always(self):
+        table = TranspositionTable(64)
+        table.add(5, 1.0)
+        table.add(5, 1.0)
+        # Same slot, another position
+        table.add(5 + 64, -1.0)
+        self.assertIsNone(table.get(5))
+        self.assertEqual((1, -1.0), table.get(5 + 64))
+        table.add(1 << 63 | 7, 0.5)
+        self.assertEqual((1, 0.5), table.get(1 << 63 | 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
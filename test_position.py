@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+import os
+import random
+import shutil
+import stat
+import tempfile
+import unittest
+
+import position
+
+
+
+
+def random_game(rng, depth=2, plies=None):
+    """Yields the positions of a random game from the start, to the end or
+    for plies moves"""
+    pos = position.Position(rng.choice((position.X, position.O)), depth)
+    yield pos.copy()
+    while pos.winner is None and (plies is None or pos.ply < plies):
+        pos.play(pos.random_move(rng))
+        yield pos.copy()
+
+
+class NotationTest(unittest.TestCase):
+
+    def check_round_trip(self, pos):
+        text = position.to_notation(pos)
+        other = position.from_notation(text)
+        self.assertEqual(pos, other)
+        self.assertEqual(pos.hash, other.hash)
+        self.assertEqual(pos.levels, other.levels)
+        self.assertEqual(pos.winner, other.winner)
+        self.assertEqual(text, position.to_notation(other))
+
+    def test_startpos(self):
+        pos = position.from_notation(position.STARTPOS)
+        self.assertEqual(position.Position(), pos)
+        self.assertEqual(position.Position().hash, pos.hash)
+        self.assertEqual("9/9/9/9/9/9/9/9/9 x -", position.to_notation(pos))
+
+    def test_depth_2_round_trip(self):
+        rng = random.Random(1)
+        for game in range(20):
+            for pos in random_game(rng):
+                self.check_round_trip(pos)
+
+    def test_move_notation(self):
+        for depth in (2, 3):
+            for move in range(9 ** depth):
+                text = position.to_move_notation(move, depth)
+                self.assertEqual(2 * depth, len(text))
+                self.assertEqual(move, position.from_move_notation(text, depth))
+        self.assertEqual(2, position.from_move_notation("0002"))
+        self.assertEqual(9 * 4 + 2, position.from_move_notation("1102"))
+
+    def test_depth_3_round_trip(self):
+        rng = random.Random(2)
+        forced_levels = set()
+        for game in range(3):
+            for pos in random_game(rng, 3):
+                self.check_round_trip(pos)
+                if pos.forced != position.ANY:
+                    forced_levels.add(pos.forced_level)
+        # Play was sent to a closed board, so had to go in the board above it
+        self.assertEqual({1, 2}, forced_levels)
+
+    def test_forced_board_above_level_1(self):
+        text = "/".join(["27"] * 27) + " o 11"
+        pos = position.from_notation(text)
+        self.assertEqual((2, 4), pos.region())
+        self.assertEqual(text, position.to_notation(pos))
+        self.assertTrue(all(m // 81 == 4 for m in pos.legal_moves()))
+        self.assertEqual(81, len(pos.legal_moves()))
+        with self.assertRaises(ValueError):
+            position.from_notation("/".join(["27"] * 27) + " o 111111")
+
+
+class PlayTest(unittest.TestCase):
+
+    def test_wins_propagate(self):
+        # Each move only checks the boards containing it; working every
+        # board out again from the squares must agree
+        rng = random.Random(3)
+        for depth in (2, 3):
+            closed = 0
+            for game in range(4):
+                for pos in random_game(rng, depth):
+                    other = position.Position.from_cells(pos.cells, pos.player)
+                    self.assertEqual(other.levels, pos.levels)
+                    self.assertEqual(other.winner, pos.winner)
+                if depth == 3:
+                    closed += sum(1 for b in pos.levels[2] if b != position.EMPTY)
+                self.assertIsNotNone(pos.winner)
+            if depth == 3:
+                self.assertGreater(closed, 0)
+
+    def test_winning_move_closes_every_level(self):
+        # At depth 3, X has won the top left and top centre boards, and the
+        # first two leaf boards of the top right one, and has two of the
+        # three squares in a row on the third; completing it wins that leaf
+        # board, the top right board and the game in one move
+        cells = [position.EMPTY] * 729
+        for (top, boards) in ((0, 3), (1, 3), (2, 2)):
+            for board in range(boards):
+                for square in range(3):
+                    cells[top * 81 + board * 9 + square] = position.X
+        cells[2 * 81 + 2 * 9 + 0] = position.X
+        cells[2 * 81 + 2 * 9 + 1] = position.X
+        pos = position.Position.from_cells(cells, position.X)
+        self.assertIsNone(pos.winner)
+        self.assertEqual([position.X, position.X, position.EMPTY], pos.levels[2][:3])
+        move = position.from_move_notation("020202", 3)
+        self.assertTrue(pos.is_legal(move))
+        pos.play(move)
+        self.assertEqual(position.X, pos.levels[1][2 * 9 + 2])
+        self.assertEqual(position.X, pos.levels[2][2])
+        self.assertEqual(position.X, pos.winner)
+        self.assertEqual([], pos.legal_moves())
+
+class TablesTest(unittest.TestCase):
+
+    def test_cache_file_is_readable_by_everyone(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "tables.bin")
+            position.tables(2).save(path)
+            self.assertEqual(0o644, stat.S_IMODE(os.stat(path).st_mode))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+# Trains the pattern table evaluator in evaluator.py by self-play. Each
+# generation, worker processes play games with the current weights, choosing
+# the move that looks best one ply ahead (or a random one, some of the time),
+# and the weights are then updated with TD(lambda) over every position of
+# every game in one batch.
+#
+#   python train.py weights.bin [--generations N] [--games N] [--jobs N]
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+
+import numpy
+
+import position
+from evaluator import CHILD_PATTERNS, Evaluator, encode
+
+
+def self_play(args):
+    """Plays games with the weights in weights_path (or zero weights if there
+    are none yet). Returns a list of (features, result) for each game, where
+    features are the encode() arrays for each position in the game and result
+    is 1, 0 or -1 for X."""
+    (weights_path, games, epsilon, seed) = args
+    if os.path.exists(weights_path):
+        evaluator = Evaluator.load(weights_path)
+    else:
+        evaluator = Evaluator()
+    rng = random.Random(seed)
+
+    played = []
+    for g in range(games):
+        pos = position.Position(rng.choice((position.X, position.O)))
+        seen = []
+        while pos.winner is None:
+            seen.append(pos.copy())
+            moves = pos.legal_moves()
+            if rng.random() < epsilon:
+                pos.play(rng.choice(moves))
+                continue
+            children = []
+            for move in moves:
+                child = pos.copy()
+                child.play(move)
+                children.append(child)
+            # Values for the player to move in each child, who is the opponent
+            values = evaluator.evaluate_batch(children)
+            for (i, child) in enumerate(children):
+                if child.winner is not None:
+                    values[i] = child.result(child.player)
+            best = numpy.flatnonzero(values == values.min())
+            pos = children[rng.choice(best)]
+        played.append((encode(seen), pos.result(position.X)))
+    return played
+
+
+def td_lambda(evaluator, games, alpha, lam):
+    """Updates evaluator's weights in place with one batched TD(lambda) step
+    over games, a list of (features, result) from self_play(). Returns the
+    mean squared error of the values before the update, against the
+    lambda-returns and against the results of the games."""
+    child_index = numpy.concatenate([f[0] for (f, z) in games])
+    main_index = numpy.concatenate([f[1] for (f, z) in games])
+    side = numpy.concatenate([f[2] for (f, z) in games])
+    values = evaluator.values(child_index, main_index, side)
+
+    # The lambda-return for each position, working back from the result of
+    # its game. Values are all for X, so there is no need to flip signs.
+    targets = numpy.empty_like(values)
+    results = numpy.empty_like(values)
+    end = 0
+    for (features, z) in games:
+        start = end
+        end += len(features[1])
+        results[start:end] = z
+        target = z
+        for t in range(end - 1, start - 1, -1):
+            targets[t] = target
+            target = (1 - lam) * values[t] + lam * target
+
+    # Each weight moves by the mean of its samples' updates rather than their
+    # sum, as some (such as the main board with nothing closed) are in almost
+    # every position and would otherwise take steps thousands of times too big
+    error = targets - values
+    delta = alpha * error * (1 - values * values)  # d tanh(x) / dx
+    child_index = child_index + numpy.arange(9) * CHILD_PATTERNS
+    evaluator.child += _mean_update(
+        child_index.ravel(), numpy.repeat(delta, 9), 9 * CHILD_PATTERNS).reshape(9, CHILD_PATTERNS)
+    evaluator.main += _mean_update(main_index, delta, len(evaluator.main))
+    evaluator.tempo += float(numpy.dot(delta, side)) / len(delta)
+    return (float(numpy.mean(error * error)), float(numpy.mean((results - values) ** 2)))
+
+
+def _mean_update(index, delta, size):
+    """Returns an array of size with the mean of the deltas for each index,
+    or 0 where there are none"""
+    total = numpy.bincount(index, weights=delta, minlength=size)
+    count = numpy.bincount(index, minlength=size)
+    return total / numpy.maximum(count, 1)
+
+
+def train(weights_path, generations, games, jobs=None, alpha=0.1, lam=0.7, epsilon=0.1, progress=None):
+    """Runs generations of self-play and training, saving the weights to
+    weights_path after each one"""
+    jobs = jobs or os.cpu_count() or 1
+    if os.path.exists(weights_path):
+        evaluator = Evaluator.load(weights_path)
+    else:
+        evaluator = Evaluator()
+        evaluator.save(weights_path)
+    seeds = random.Random()
+
+    with multiprocessing.Pool(jobs) as pool:
+        for generation in range(generations):
+            # Split the games as evenly as possible between the workers
+            shares = [games // jobs + (1 if i < games % jobs else 0) for i in range(jobs)]
+            tasks = [(weights_path, n, epsilon, seeds.getrandbits(32)) for n in shares if n]
+            played = [game for result in pool.map(self_play, tasks) for game in result]
+            (td_error, result_error) = td_lambda(evaluator, played, alpha, lam)
+            evaluator.save(weights_path)
+            if progress is not None:
+                progress(generation, td_error, result_error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the evaluator by self-play.")
+    parser.add_argument("weights", help="weights file, which is created if it doesn't exist")
+    parser.add_argument("--generations", type=int, default=100)
+    parser.add_argument("--games", type=int, default=1000, help="self-play games per generation")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--alpha", type=float, default=0.1, help="learning rate")
+    parser.add_argument("--lambda", dest="lam", type=float, default=0.7)
+    parser.add_argument("--epsilon", type=float, default=0.1, help="fraction of random moves in self-play")
+    args = parser.parse_args(argv)
+
+    def progress(generation, td_error, result_error):
+        print("generation {} error {:.4f} result error {:.4f}".format(
+            generation, td_error, result_error), file=sys.stderr)
+
+    train(args.weights, args.generations, args.games, args.jobs, args.alpha, args.lam, args.epsilon, progress)
+
+
+if __name__ == "__main__":
+    main()
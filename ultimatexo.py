@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+# One entry point for everything:
+#
+#   python -m ultimatexo [command] [arguments]
+#
+# Each command only imports the modules it needs when it is run, so the
+# engine and the command line tools start without loading tkinter (or NumPy,
+# except for train), and nothing here is slower to start than running the
+# module itself.
+
+import importlib
+import sys
+
+# command: (module, description); each module has a main(argv) function
+COMMANDS = {
+    "gui": ("main", "play the game (the default)"),
+    "engine": ("engine", "run the engine, reading commands from stdin"),
+    "batch": ("batch", "analyse a file of positions"),
+    "book": ("book", "build or probe an opening book"),
+    "train": ("train", "train the evaluator by self-play"),
+    "render": ("render", "draw positions as SVG or PostScript files"),
+}
+
+
+def usage():
+    lines = ["usage: python -m ultimatexo [command] [arguments]", "", "commands:"]
+    for (command, (module, description)) in COMMANDS.items():
+        lines.append("  {:<8} {}".format(command, description))
+    lines.append("")
+    lines.append("Use python -m ultimatexo <command> --help for a command's arguments.")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command = argv[0] if argv else "gui"
+    if command not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        sys.exit(2)
+    # So that argparse names the command properly in usage messages
+    sys.argv[0] = "python -m ultimatexo {}".format(command)
+    module = importlib.import_module(COMMANDS[command][0])
+    module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    main()